@@ -0,0 +1,440 @@
+"""
+Run Generator.generate end to end against local stand-ins for the PREdbs,
+stores and Discord, and record wall time, requests, peak memory and
+throughput.
+
+    python -m benchmarks.bench_generate --sizes 100 1000 10000 --latency 50
+    python -m benchmarks.bench_generate --compare old.json new.json
+
+Every run gets a fresh data dir and process, so runs start from a cold cache
+and don't share memory. The stand-ins run in this process, so they don't
+compete with the generator for the GIL.
+"""
+
+import argparse
+import configparser
+import json
+import os
+import platform
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent.joinpath("results")
+
+GROUPS = ["CODEX", "SKIDROW", "PLAZA", "DOGE", "TENOKE", "RUNE", "FLT",
+          "DINOByTES", "GOG", "I_KnoW"]
+UPDATE_SUFFIXES = ["Update.v1.0.{}", "Build.{}", "Hotfix.{}", "Update.v2.{}.Incl.DLC"]
+DLC_SUFFIXES = ["DLC.Pack.{}", "Soundtrack.DLC.{}"]
+# Share of titles found by every store
+HIT_RATES = {"steam": 70, "gog": 30, "epic": 20}
+
+
+def crc(*parts) -> int:
+    return zlib.crc32("/".join(map(str, parts)).encode())
+
+
+def found(store: str, title: str) -> bool:
+    return crc(store, title.lower()) % 100 < HIT_RATES[store]
+
+
+class Feed:
+    """Synthetic releases pred during the last 24 hours, newest first"""
+
+    def __init__(self, size: int, seed: int = 0):
+        rng = random.Random(seed)
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))).title()
+                 for _ in range(2000)]
+        # Updates and DLCs share their game's name, like the real feeds
+        games = [".".join(rng.choices(words, k=rng.randint(1, 4)))
+                 for _ in range(max(size * 3 // 5, 1))]
+        now = time.time()
+        self.releases = []
+        dirnames = set()
+        while len(self.releases) < size:
+            game = rng.choice(games)
+            kind = rng.random()
+            if kind < 0.6:
+                name = game
+                category = "CRACKED"
+            elif kind < 0.9:
+                name = f"{game}.{rng.choice(UPDATE_SUFFIXES).format(rng.randint(1, 999))}"
+                category = "UPDATE"
+            else:
+                name = f"{game}.{rng.choice(DLC_SUFFIXES).format(rng.randint(1, 99))}"
+                category = "CRACKED"
+            group = rng.choice(GROUPS)
+            dirname = f"{name}-{group}"
+            if dirname in dirnames:
+                continue
+            dirnames.add(dirname)
+            source = rng.choices(["xrel", "p2p", "predb"], weights=[6, 1, 3])[0]
+            self.releases.append({
+                "dirname": dirname,
+                "group": group,
+                "category": category,
+                "source": source,
+                # predb.net lists most xrel releases too
+                "also_predb": source != "predb" and rng.random() < 0.3,
+                "time": int(now - rng.uniform(60, 24 * 3600)),
+            })
+        self.releases.sort(key=lambda release: release["time"], reverse=True)
+        self.titles = {game.replace(".", " ") for game in games}
+
+    def page(self, releases: list, page: int, per_page: int = 100):
+        total_pages = max((len(releases) + per_page - 1) // per_page, 1)
+        return releases[(page - 1) * per_page:page * per_page], total_pages
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def do_HEAD(self):
+        self.handle_request()
+
+    def handle_request(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        url = urlsplit(self.path)
+        host, _, path = url.path.lstrip("/").partition("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        server.count(host)
+
+        latency = server.latency
+        if server.jitter:
+            latency += random.uniform(0, server.jitter)
+        time.sleep(latency)
+        if self.command != "HEAD" and random.random() < server.error_rate:
+            server.count(host, "errors")
+            return self.reply(503, {"error": "injected"}, {"Retry-After": "0"})
+
+        try:
+            status, data = server.route(host, path, query, body)
+        except Exception as e:
+            status, data = 500, {"error": repr(e)}
+        self.reply(status, data)
+
+    def reply(self, status: int, data, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, feed: Feed, latency: float, jitter: float,
+                 error_rate: float):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.feed = feed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def handle_error(self, request, client_address):
+        # Clients closing kept-alive connections when they exit isn't an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, host: str, counter: str = "requests"):
+        with self.lock:
+            counts = getattr(self, counter)
+            counts[host] = counts.get(host, 0) + 1
+
+    def route(self, host: str, path: str, query: dict, body: bytes):
+        feed = self.feed
+        page = int(query.get("page", 1))
+        if host == "api.xrel.to" and path == "v2/release/browse_category.json":
+            releases = [r for r in feed.releases if r["source"] == "xrel"
+                        and r["category"] == query["category_name"]]
+            releases, total_pages = feed.page(releases, page, int(query["per_page"]))
+            return 200, {"list": [{"dirname": r["dirname"], "group_name": r["group"],
+                                   "time": r["time"],
+                                   "link_href": f"{self.url}/nfo/{r['dirname']}"}
+                                  for r in releases],
+                         "pagination": {"current_page": page, "total_pages": total_pages}}
+        if host == "api.xrel.to" and path == "v2/p2p/releases.json":
+            releases = [r for r in feed.releases if r["source"] == "p2p"]
+            releases, total_pages = feed.page(releases, page, int(query["per_page"]))
+            return 200, {"list": [{"dirname": r["dirname"], "group": {"name": r["group"]},
+                                   "pub_time": r["time"],
+                                   "link_href": f"{self.url}/nfo/{r['dirname']}"}
+                                  for r in releases],
+                         "pagination": {"current_page": page, "total_pages": total_pages}}
+        if host == "api.predb.net":
+            releases = [r for r in feed.releases
+                        if r["source"] == "predb" or r["also_predb"]]
+            releases, _ = feed.page(releases, page)
+            return 200, {"results": len(releases),
+                         "data": [{"release": r["dirname"], "group": r["group"],
+                                   "pretime": r["time"]} for r in releases]}
+        if host == "store.steampowered.com" and path == "search/suggest":
+            term = query["term"]
+            items = [{"name": f"Unrelated {crc(term) % 1000}", "id": str(crc(term) % 100000),
+                      "type": "game"}]
+            if found("steam", term):
+                items.insert(0, {"name": term, "id": str(crc("steam", term) % 1000000),
+                                 "type": "game"})
+            return 200, items
+        if host == "store.steampowered.com" and path.startswith("appreviews/"):
+            appid = int(path.rpartition("/")[2])
+            total = appid % 5000
+            return 200, {"success": 1, "query_summary": {
+                "total_positive": total * 4 // 5, "total_reviews": total}}
+        if host == "www.gog.com":
+            term = query["search"]
+            products = []
+            if found("gog", term):
+                products.append({"title": term, "isGame": True,
+                                 "slug": term.lower().replace(" ", "_")})
+            return 200, {"products": products}
+        if host == "graphql.epicgames.com":
+            keywords = json.loads(body)["variables"].get("keywords", "")
+            elements = []
+            if found("epic", keywords):
+                elements.append({"title": keywords, "id": f"offer{crc('epic', keywords.lower())}"})
+            return 200, {"data": {"Catalog": {"searchStore": {"elements": elements}}}}
+        if host == "offerids":
+            return 200, {f"offer{crc('epic', title.lower())}": title.lower().replace(" ", "-")
+                         for title in feed.titles}
+        if host == "discord":
+            return 200, {"id": str(int(time.time() * 1000))}
+        return 404, {"error": f"no stand-in for {host}/{path}"}
+
+
+def write_config(home: Path, server_url: str, args):
+    config = configparser.ConfigParser()
+    config.read(REPO_ROOT.joinpath("dailyreleases", "config.ini.default"))
+    config["main"]["mode"] = "test"
+    config["main"]["egs_offeridapi_url"] = f"{server_url}/offerids"
+    config["main"]["backup_nfos"] = "no"
+    config["logging"]["level"] = args.log_level
+    config["discord"]["webhook_url"] = f"{server_url}/discord/webhook"
+    config["discord"]["enable_debughook"] = "no"
+    config["discord"]["live_updates"] = "no"
+    web = config["web"]
+    web["warm_up_seconds"] = "0"
+    # The feeds page 100 releases at a time
+    web["predb_max_pages"] = str(args.size // 100 + 2)
+    web["host_rate_limit"] = str(args.rate_limit)
+    # Read as an int, a burst of at least one request
+    web["host_rate_burst"] = str(max(1, int(args.rate_limit)))
+    # Every stand-in is on the same local port, so they share a pool
+    web["pool_maxsize"] = "64"
+    config["metrics"]["textfile"] = ""
+    data_dir = home.joinpath(".dailyreleases")
+    data_dir.mkdir(parents=True, exist_ok=True)
+    with data_dir.joinpath("config.ini").open("w") as file:
+        config.write(file)
+
+
+def run_child(args):
+    """Generate once in this process, which has a fresh data dir"""
+    import logging
+    import tracemalloc
+
+    from dailyreleases import __version__
+    from dailyreleases.APIHelper import APIHelper
+    from dailyreleases.Config import CONFIG
+    from dailyreleases.Generator import Generator
+    from dailyreleases.RateLimiter import RATE_LIMITER, RateLimitedAdapter
+    from dailyreleases.stores import Epic
+    from requests.adapters import HTTPAdapter
+
+    class StandInRoute(HTTPAdapter):
+        # Below the rate limiter, so hosts are still paced one by one
+        def send(self, request, **kwargs):
+            url = urlsplit(request.url)
+            if url.netloc != urlsplit(args.server).netloc:
+                request.url = f"{args.server}/{url.netloc}{url.path}" + (
+                    f"?{url.query}" if url.query else "")
+            return super().send(request, **kwargs)
+
+    class StandInAdapter(RateLimitedAdapter, StandInRoute):
+        pass
+
+    web_config = CONFIG.CONFIG["web"]
+    for session in (APIHelper.get_session(), Epic.api._session):
+        adapter = StandInAdapter(RATE_LIMITER, timeout=APIHelper.get_timeout(),
+                                 pool_connections=web_config.getint("pool_connections", fallback=10),
+                                 pool_maxsize=web_config.getint("pool_maxsize", fallback=10))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    if args.log_level != "DEBUG":
+        logging.getLogger("dailyreleases").setLevel(args.log_level)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    generator = Generator()
+    generator.generate(discord_post=True)
+    generate_time = time.perf_counter() - start
+    delivered = generator.outbox.drain(120)
+    wall_time = time.perf_counter() - start
+
+    posted = len(generator.cache.get_pres_by_dirnames(
+        generator.checkpoint.output("filter")))
+    result = {
+        "version": __version__,
+        "releases_posted": posted,
+        "generate_seconds": round(generate_time, 3),
+        "wall_seconds": round(wall_time, 3),
+        "delivered": delivered,
+        "throughput_per_second": round(posted / generate_time, 2) if generate_time else None,
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rate_limits": RATE_LIMITER.snapshot(),
+    }
+    if args.trace_memory:
+        result["peak_traced_mib"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    Path(args.result_file).write_text(json.dumps(result))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_size(size: int, args) -> dict:
+    feed = Feed(size, seed=args.seed)
+    server = StandInServer(feed, args.latency / 1000, args.jitter / 1000, args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            child_args = argparse.Namespace(**vars(args))
+            child_args.size = size
+            write_config(Path(home), server.url, child_args)
+            result_file = Path(home).joinpath("result.json")
+            command = [sys.executable, "-m", "benchmarks.bench_generate", "--child",
+                       "--server", server.url, "--result-file", str(result_file),
+                       "--log-level", args.log_level]
+            if args.trace_memory:
+                command.append("--trace-memory")
+            start = time.perf_counter()
+            process = subprocess.run(command, cwd=REPO_ROOT, env=dict(os.environ, HOME=home),
+                                     stdout=subprocess.DEVNULL if not args.verbose else None)
+            if process.returncode != 0:
+                raise RuntimeError(f"Run with {size} releases failed")
+            result = json.loads(result_file.read_text())
+            result["process_seconds"] = round(time.perf_counter() - start, 3)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    result["releases_per_day"] = size
+    result["requests"] = dict(sorted(server.requests.items()))
+    result["requests_total"] = sum(server.requests.values())
+    result["errors_injected"] = sum(server.errors.values())
+    return result
+
+
+def compare(old_path: Path, new_path: Path):
+    old, new = (json.loads(path.read_text()) for path in (old_path, new_path))
+    print(f"{old['revision']} -> {new['revision']}")
+    old_runs = {run["releases_per_day"]: run for run in old["runs"]}
+    for run in new["runs"]:
+        before = old_runs.get(run["releases_per_day"])
+        if before is None:
+            continue
+        print(f"{run['releases_per_day']:>6} releases/day:")
+        for key in ("generate_seconds", "wall_seconds", "requests_total",
+                    "peak_rss_mib", "throughput_per_second"):
+            if before.get(key) is None or run.get(key) is None:
+                continue
+            change = (run[key] - before[key]) / before[key] if before[key] else 0
+            print(f"    {key:<22} {before[key]:>10} -> {run[key]:>10} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="releases per day of every run")
+    parser.add_argument("--latency", type=float, default=50, help="ms per response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many ms more")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="share of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=1000,
+                        help="requests/s per host, the default config has 10")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report the peak memory traced by tracemalloc")
+    parser.add_argument("--output", type=Path, help="defaults to benchmarks/results/")
+    parser.add_argument("--verbose", action="store_true", help="show the generator's log")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.child:
+        run_child(args)
+        return
+
+    results = {
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {"latency_ms": args.latency, "jitter_ms": args.jitter,
+                     "error_rate": args.error_rate, "rate_limit": args.rate_limit,
+                     "seed": args.seed, "log_level": args.log_level},
+        "runs": [],
+    }
+    for size in args.sizes:
+        result = run_size(size, args)
+        results["runs"].append(result)
+        print(f"{size:>6} releases/day: {result['releases_posted']:>6} posted in "
+              f"{result['generate_seconds']:8.2f} s ({result['throughput_per_second']} /s), "
+              f"{result['requests_total']:>6} requests, {result['errors_injected']} errors "
+              f"injected, peak RSS {result['peak_rss_mib']} MiB")
+
+    output = args.output or RESULTS_DIR.joinpath(
+        f"{results['revision']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # Sorted and indented, so results of two versions diff line by line
+    output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
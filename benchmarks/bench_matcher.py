@@ -0,0 +1,78 @@
+"""
+Compare TitleMatcher with difflib.get_close_matches on large title sets.
+
+    python -m benchmarks.bench_matcher --titles 1000 10000 100000 --queries 50
+"""
+
+import argparse
+import difflib
+import random
+import string
+import time
+
+from dailyreleases.TitleMatcher import TitleMatcher
+
+
+def random_titles(count, rng):
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+             for _ in range(5000)]
+    return [" ".join(rng.choices(words, k=rng.randint(1, 6))).title()
+            for _ in range(count)]
+
+
+def misspell(title, rng):
+    # Drop, swap or change a character like a scene dirname would
+    i = rng.randrange(len(title))
+    return rng.choice((
+        title[:i] + title[i + 1:],
+        title[:i] + rng.choice(string.ascii_lowercase) + title[i + 1:],
+        title.upper(),
+        title.replace(" ", "."),
+    ))
+
+
+def difflib_matches(word, possibilities, n, cutoff):
+    close_matches = difflib.get_close_matches(word.lower(), possibilities, n=n, cutoff=cutoff)
+    return [possibilities[m] for m in close_matches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--titles", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--cutoff", type=float, default=0.90)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for count in args.titles:
+        titles = random_titles(count, rng)
+        queries = [misspell(rng.choice(titles), rng) for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        possibilities = {title.lower(): title for title in titles}
+        expected = [difflib_matches(q, possibilities, 3, args.cutoff) for q in queries]
+        difflib_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = TitleMatcher(titles)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = [matcher.get_close_matches(q, 3, args.cutoff) for q in queries]
+        query_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = matcher.get_close_matches_many(queries, 3, args.cutoff, workers=args.workers)
+        batch_time = time.perf_counter() - start
+
+        agreement = sum(e == a for e, a in zip(expected, actual)) / len(queries)
+        assert batch == actual
+        print(f"{count:>7} titles: difflib {difflib_time / len(queries) * 1000:9.2f} ms/query | "
+              f"index build {build_time:6.2f} s, {query_time / len(queries) * 1000:7.2f} ms/query, "
+              f"batch {batch_time / len(queries) * 1000:7.2f} ms/query | "
+              f"agreement {agreement:.0%}")
+
+
+if __name__ == "__main__":
+    main()
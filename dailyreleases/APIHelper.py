@@ -2,21 +2,98 @@
 
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from urllib.error import HTTPError
+from urllib.parse import urlsplit
 
+from .Cassette import Cassette, CassetteAdapter
 from .Config import CONFIG
+from .Metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from .RateLimiter import RATE_LIMITER, RateLimitedAdapter
 
 logger = logging.getLogger(__name__)
 
 
 class APIHelper():
+    # A single session is shared by all subclasses, so connections to a host
+    # are kept alive and reused no matter which class sends the request.
+    session = None
+    session_lock = threading.Lock()
+    # Shared by the sessions of all clients, so one run goes into one cassette
+    cassette = None
+    cassette_lock = threading.Lock()
+
     def __init__(self):
         pass
 
-    def send_request(self, url: str, parameters: dict = None):
+    @staticmethod
+    def mount_adapter(session: requests.Session):
+        """
+        Send all requests of `session` through pooled connections and the
+        rate limiter of their host. Requests sent without a timeout get the
+        configured one, so a hung host never blocks them forever.
+        """
+        web_config = CONFIG.CONFIG["web"]
+        pool_config = dict(
+            timeout=APIHelper.get_timeout(),
+            # number of hosts to keep a connection pool for
+            pool_connections=web_config.getint("pool_connections",
+                                               fallback=10),
+            # number of connections kept alive per host
+            pool_maxsize=web_config.getint("pool_maxsize", fallback=10),
+        )
+        mode = CONFIG.CONFIG.get("cassette", "mode", fallback="off")
+        if mode == "off":
+            adapter = RateLimitedAdapter(RATE_LIMITER, **pool_config)
+        else:
+            latency = CONFIG.CONFIG.get("cassette", "latency",
+                                        fallback="recorded")
+            adapter = CassetteAdapter(
+                APIHelper.get_cassette(), mode, RATE_LIMITER,
+                latency=None if latency == "recorded" else float(latency) / 1000,
+                **pool_config)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    @staticmethod
+    def get_cassette() -> Cassette:
+        with APIHelper.cassette_lock:
+            if APIHelper.cassette is None:
+                path = CONFIG.DATA_DIR.joinpath(CONFIG.CONFIG.get(
+                    "cassette", "path", fallback="cassette.sqlite"))
+                logger.info(f"Cassette mode is {CONFIG.CONFIG['cassette']['mode']}, "
+                            f"using {path}")
+                APIHelper.cassette = Cassette(path)
+            return APIHelper.cassette
+
+    @staticmethod
+    def get_session() -> requests.Session:
+        with APIHelper.session_lock:
+            if APIHelper.session is None:
+                session = requests.Session()
+                APIHelper.mount_adapter(session)
+                APIHelper.session = session
+            return APIHelper.session
+
+    @staticmethod
+    def get_timeout() -> tuple:
+        web_config = CONFIG.CONFIG["web"]
+        return (web_config.getfloat("connect_timeout", fallback=5),
+                web_config.getfloat("read_timeout", fallback=30))
+
+    def send_request(self, url: str, parameters: dict = None,
+                     headers: dict = None, stream=False):
+        host = urlsplit(url).netloc
+        status = "error"
         try:
-            response = requests.get(url, params=parameters)
+            with HTTP_REQUEST_SECONDS.time(host=host):
+                response = self.get_session().get(url, params=parameters,
+                                                  headers=headers,
+                                                  stream=stream,
+                                                  timeout=self.get_timeout())
+            status = response.status_code
             response.raise_for_status()
 
             return response
@@ -24,3 +101,26 @@ class APIHelper():
             logger.exception(e)
             logger.warning("Failed to send request.")
             return None
+        finally:
+            HTTP_REQUESTS.inc(host=host, status=status)
+
+    def warm_up(self, urls: List[str], session: requests.Session = None):
+        """
+        Open a connection to the host of every url, so DNS lookups and TLS
+        handshakes are done before the connections are actually needed.
+        `session` defaults to the shared one.
+        """
+        session = session or self.get_session()
+        hosts = {f"{url.scheme}://{url.netloc}/"
+                 for url in map(urlsplit, urls)}
+        logger.debug("Warming up connections to %s", ", ".join(hosts))
+
+        def head(host):
+            try:
+                session.head(host, timeout=self.get_timeout())
+            except requests.RequestException as e:
+                logger.debug("Failed to warm up connection to %s: %s", host, e)
+
+        with ThreadPoolExecutor(max_workers=len(hosts) or 1,
+                                thread_name_prefix="warmup") as executor:
+            executor.map(head, hosts)
@@ -1,84 +1,414 @@
 """The cache class is used to interact with the sqlite3 database"""
 
+import json
 import logging
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta, datetime
+from typing import List, Optional, Tuple
 
 from .Pre import Pre
 from .Config import CONFIG
+from .Metrics import CACHE_LOOKUPS
 
 
 logger = logging.getLogger(__name__)
 
+# Schema migrations in order. Migration n migrates the cache to schema version
+# n + 1, the current version is stored in the database's user_version.
+MIGRATIONS = (
+    # 1: Initial schema. Existing caches from before versioning already have
+    # the pres table, so everything is created only if it doesn't exist.
+    """
+    CREATE TABLE IF NOT EXISTS
+    pres (id INTEGER PRIMARY KEY,
+          dirname TEXT,
+          nfo_link TEXT,
+          group_name TEXT,
+          timestamp INTEGER);
+
+    -- result is NULL if the game couldn't be found in the store
+    CREATE TABLE IF NOT EXISTS
+    lookups (store TEXT,
+             query TEXT,
+             result TEXT,
+             timestamp INTEGER,
+             PRIMARY KEY (store, query));
+
+    CREATE TABLE IF NOT EXISTS
+    reviews (appid TEXT PRIMARY KEY,
+             positive_reviews INTEGER,
+             total_reviews INTEGER,
+             timestamp INTEGER);
+    """,
+    # 2: Without a unique dirname, INSERT OR REPLACE piled up duplicates. Keep
+    # only the latest row of every dirname and index the columns we query by.
+    """
+    DELETE FROM pres
+    WHERE id NOT IN (SELECT MAX(id) FROM pres GROUP BY dirname);
+
+    CREATE UNIQUE INDEX pres_dirname ON pres (dirname);
+    CREATE INDEX pres_timestamp ON pres (timestamp);
+    CREATE INDEX lookups_timestamp ON lookups (timestamp);
+    CREATE INDEX reviews_timestamp ON reviews (timestamp);
+    """,
+    # 3: Newest release timestamp seen from every PREdb source, so only
+    # releases since then are fetched.
+    """
+    CREATE TABLE watermarks (source TEXT PRIMARY KEY,
+                             timestamp INTEGER);
+    """,
+    # 4: Pres are enriched when they are polled, and only marked as posted
+    # once they are. Before, every cached pre had been posted.
+    """
+    ALTER TABLE pres ADD COLUMN steam_link TEXT;
+    ALTER TABLE pres ADD COLUMN gog_link TEXT;
+    ALTER TABLE pres ADD COLUMN epic_link TEXT;
+    ALTER TABLE pres ADD COLUMN positive_reviews INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE pres ADD COLUMN total_reviews INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE pres ADD COLUMN enriched_at INTEGER;
+    ALTER TABLE pres ADD COLUMN posted_at INTEGER;
+    UPDATE pres SET posted_at = timestamp;
+    """,
+)
+
 
 class Cache:
-    def __init__(self):
-        connection = sqlite3.connect(CONFIG.DATA_DIR.joinpath("cache.sqlite"))
+    def __init__(self, path=None):
+        # store lookups happen from the enricher's worker threads, access to
+        # the connection is serialized by the lock instead
+        connection = sqlite3.connect(
+            path or CONFIG.DATA_DIR.joinpath("cache.sqlite"),
+            check_same_thread=False)
         # allow accessing rows by index and case-insensitively by name
         connection.row_factory = sqlite3.Row
         self.connection = connection
+        self.lock = threading.RLock()
         self.cache_time = timedelta(seconds=CONFIG.CONFIG["web"].getint(
             "cache_time"))
+        self.negative_cache_time = timedelta(seconds=CONFIG.CONFIG.getint(
+            "web", "negative_cache_time", fallback=3600))
+        # in-process LRU in front of the lookups table
+        self.lookup_lru = OrderedDict()
+        self.lookup_lru_size = CONFIG.CONFIG.getint("web", "lookup_lru_size",
+                                                    fallback=1024)
+        self.lookup_stats = {}
+        self.review_cache_time = timedelta(seconds=CONFIG.CONFIG.getint(
+            "web", "review_cache_time", fallback=21600))
         self.setup()
 
     def setup(self):
         logger.debug("Setting up cache.")
-        self.connection.execute(
-            """
-            CREATE TABLE IF NOT EXISTS
-            pres (id INTEGER PRIMARY KEY,
-                  dirname TEXT,
-                  nfo_link TEXT,
-                  group_name TEXT,
-                  timestamp INTEGER);
-            """
-        )
-        self.connection.commit()
+        with self.lock:
+            version = self.connection.execute(
+                "PRAGMA user_version;").fetchone()[0]
+            for number, migration in enumerate(MIGRATIONS[version:],
+                                               start=version + 1):
+                logger.info("Migrating cache to schema version %s", number)
+                try:
+                    # executescript doesn't take parameters, but the version
+                    # is always an int
+                    self.connection.executescript(
+                        f"BEGIN; {migration} PRAGMA user_version = {number}; COMMIT;"
+                    )
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
 
     def clean(self, older_than_days=7):
         # Removes PREs from Cache that are older than specified days
         cutoff_timestamp = (datetime.utcnow() - timedelta(
             days=older_than_days)).timestamp()
-        self.connection.execute(
-            """
-            DELETE FROM pres
-            WHERE timestamp < :cutoff;
-            """,
-            {
-                "cutoff": cutoff_timestamp,
-            },
-        )
-        self.connection.commit()
-        self.connection.executescript("VACUUM;")
-
-    def get_pre_by_dirname(self, dirname: str) -> Pre:
-        row = self.connection.execute(
-            """
-            SELECT dirname, nfo_link, group_name, timestamp
-            FROM pres
-            WHERE dirname = :dirname;
-            """,
-            {"dirname": dirname},
-        ).fetchone()
-
-        if row is not None:
-            logger.debug(f"Cache hit: {dirname}")
-            return Pre.from_row(row)
-        else:
-            return None
-
-    def insert_pre(self, pre: Pre):
-        self.connection.execute(
-            """
-            INSERT OR REPLACE INTO pres(dirname, nfo_link, group_name, timestamp)
-            VALUES (:dirname, :nfo_link, :group_name, :timestamp);
-            """,
-            {
-                "dirname": pre.dirname,
-                "nfo_link": pre.nfo_link,
-                "group_name": pre.group_name,
-                "timestamp": pre.timestamp,
-            },
-        )
-        self.connection.commit()
-        return
+        with self.lock:
+            self.connection.execute(
+                """
+                DELETE FROM pres
+                WHERE timestamp < :cutoff;
+                """,
+                {
+                    "cutoff": cutoff_timestamp,
+                },
+            )
+            # Removes store lookups that have expired
+            self.connection.execute(
+                """
+                DELETE FROM lookups
+                WHERE timestamp < :cutoff;
+                """,
+                {
+                    "cutoff": time.time() - max(
+                        self.cache_time, self.negative_cache_time
+                    ).total_seconds(),
+                },
+            )
+            # Stale reviews are still served, so they're kept as long as PREs
+            self.connection.execute(
+                """
+                DELETE FROM reviews
+                WHERE timestamp < :cutoff;
+                """,
+                {
+                    "cutoff": cutoff_timestamp,
+                },
+            )
+            self.connection.commit()
+            self.connection.executescript("VACUUM;")
+
+    def get_pres_to_post(self, today: Tuple[float, float],
+                         yesterday: Tuple[float, float]) -> List[Pre]:
+        """
+        Return the cached pres that go into today's post: all of today's and
+        those of yesterday that haven't been posted yet.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT dirname, nfo_link, group_name, timestamp, steam_link, gog_link, epic_link,
+                       positive_reviews, total_reviews, enriched_at
+                FROM pres
+                WHERE (timestamp >= :today_start AND timestamp < :today_end)
+                OR (timestamp >= :yesterday_start AND timestamp < :yesterday_end
+                    AND posted_at IS NULL)
+                ORDER BY timestamp;
+                """,
+                {
+                    "today_start": today[0],
+                    "today_end": today[1],
+                    "yesterday_start": yesterday[0],
+                    "yesterday_end": yesterday[1],
+                },
+            ).fetchall()
+        return [Pre.from_row(row) for row in rows]
+
+    def get_pres_by_dirnames(self, dirnames: List[str]) -> List[Pre]:
+        """Return the cached pres of `dirnames`, in the same order"""
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT dirname, nfo_link, group_name, timestamp, steam_link, gog_link, epic_link,
+                       positive_reviews, total_reviews, enriched_at
+                FROM pres
+                WHERE dirname IN (SELECT value FROM json_each(:dirnames));
+                """,
+                {"dirnames": json.dumps(dirnames)},
+            ).fetchall()
+        pres = {row["dirname"]: Pre.from_row(row) for row in rows}
+        return [pres[dirname] for dirname in dirnames if dirname in pres]
+
+    def update_enrichment(self, pres: List[Pre]):
+        """Store the store links and reviews looked up for `pres`"""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                UPDATE pres
+                SET steam_link = :steam_link, gog_link = :gog_link, epic_link = :epic_link,
+                    positive_reviews = :positive_reviews, total_reviews = :total_reviews,
+                    enriched_at = :enriched_at
+                WHERE dirname = :dirname;
+                """,
+                (
+                    {
+                        "dirname": pre.dirname,
+                        "steam_link": pre.steam_link,
+                        "gog_link": pre.gog_link,
+                        "epic_link": pre.epic_link,
+                        "positive_reviews": pre.positive_reviews,
+                        "total_reviews": pre.total_reviews,
+                        "enriched_at": int(time.time()),
+                    }
+                    for pre in pres
+                ),
+            )
+
+    def mark_posted(self, pres: List[Pre]):
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                UPDATE pres
+                SET posted_at = :posted_at
+                WHERE dirname IN (SELECT value FROM json_each(:dirnames));
+                """,
+                {
+                    "posted_at": int(time.time()),
+                    "dirnames": json.dumps([pre.dirname for pre in pres]),
+                },
+            )
+
+    def get_hourly_counts(self) -> List[int]:
+        """Return the number of cached pres released in every local hour"""
+        counts = [0] * 24
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT CAST(strftime('%H', timestamp, 'unixepoch', 'localtime') AS INTEGER) AS hour,
+                       COUNT(*) AS count
+                FROM pres
+                GROUP BY hour;
+                """
+            ).fetchall()
+        for row in rows:
+            counts[row["hour"]] = row["count"]
+        return counts
+
+    def insert_pres(self, pres: List[Pre]):
+        """
+        Insert all `pres` in a single transaction. The enrichment and posting
+        state of pres that are already cached is kept.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO pres(dirname, nfo_link, group_name, timestamp)
+                VALUES (:dirname, :nfo_link, :group_name, :timestamp)
+                ON CONFLICT (dirname) DO UPDATE
+                SET nfo_link = excluded.nfo_link,
+                    group_name = excluded.group_name,
+                    timestamp = excluded.timestamp;
+                """,
+                (
+                    {
+                        "dirname": pre.dirname,
+                        "nfo_link": pre.nfo_link,
+                        "group_name": pre.group_name,
+                        "timestamp": pre.timestamp,
+                    }
+                    for pre in pres
+                ),
+            )
+
+    def get_watermark(self, source: str) -> Optional[int]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT timestamp FROM watermarks WHERE source = :source;",
+                {"source": source},
+            ).fetchone()
+        return row["timestamp"] if row is not None else None
+
+    def set_watermarks(self, watermarks: dict):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO watermarks(source, timestamp)
+                VALUES (:source, :timestamp);
+                """,
+                (
+                    {"source": source, "timestamp": timestamp}
+                    for source, timestamp in watermarks.items()
+                ),
+            )
+
+    @staticmethod
+    def normalize_query(game_name: str) -> str:
+        return " ".join(game_name.lower().split())
+
+    def is_fresh(self, result: Optional[str], timestamp: float) -> bool:
+        # Misses expire sooner, the game might be added to the store later
+        ttl = self.cache_time if result is not None else self.negative_cache_time
+        return time.time() - timestamp < ttl.total_seconds()
+
+    def get_lookup(self, store: str, game_name: str) -> Tuple[bool, Optional[str]]:
+        """
+        Return whether a fresh result of searching `store` for `game_name` is
+        cached, and that result. The result is None if the game wasn't found.
+        """
+        key = (store, self.normalize_query(game_name))
+        with self.lock:
+            stats = self.lookup_stats.setdefault(store, [0, 0])
+            entry = self.lookup_lru.get(key)
+            if entry is None:
+                row = self.connection.execute(
+                    """
+                    SELECT result, timestamp
+                    FROM lookups
+                    WHERE store = :store AND query = :query;
+                    """,
+                    {"store": key[0], "query": key[1]},
+                ).fetchone()
+                if row is not None:
+                    entry = (row["result"], row["timestamp"])
+
+            if entry is not None and self.is_fresh(*entry):
+                self.remember_lookup(key, entry)
+                stats[0] += 1
+                CACHE_LOOKUPS.inc(cache=store, result="hit")
+                logger.debug(f"Lookup cache hit: {store} {game_name}")
+                return True, entry[0]
+
+            self.lookup_lru.pop(key, None)
+            stats[1] += 1
+            CACHE_LOOKUPS.inc(cache=store, result="miss")
+            return False, None
+
+    def insert_lookup(self, store: str, game_name: str, result: Optional[str]):
+        key = (store, self.normalize_query(game_name))
+        entry = (result, int(time.time()))
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO lookups(store, query, result, timestamp)
+                VALUES (:store, :query, :result, :timestamp);
+                """,
+                {
+                    "store": key[0],
+                    "query": key[1],
+                    "result": entry[0],
+                    "timestamp": entry[1],
+                },
+            )
+            self.connection.commit()
+            self.remember_lookup(key, entry)
+
+    def remember_lookup(self, key: tuple, entry: tuple):
+        self.lookup_lru[key] = entry
+        self.lookup_lru.move_to_end(key)
+        if len(self.lookup_lru) > self.lookup_lru_size:
+            self.lookup_lru.popitem(last=False)
+
+    def get_reviews(self, appid: str) -> Optional[Tuple[tuple, bool]]:
+        """
+        Return the cached (positive_reviews, total_reviews) of `appid` and
+        whether they are still fresh, or None if they aren't cached at all.
+        """
+        with self.lock:
+            stats = self.lookup_stats.setdefault("reviews", [0, 0])
+            row = self.connection.execute(
+                """
+                SELECT positive_reviews, total_reviews, timestamp
+                FROM reviews
+                WHERE appid = :appid;
+                """,
+                {"appid": appid},
+            ).fetchone()
+            if row is None:
+                stats[1] += 1
+                CACHE_LOOKUPS.inc(cache="reviews", result="miss")
+                return None
+
+            stats[0] += 1
+            CACHE_LOOKUPS.inc(cache="reviews", result="hit")
+            fresh = (time.time() - row["timestamp"]
+                     < self.review_cache_time.total_seconds())
+            return (row["positive_reviews"], row["total_reviews"]), fresh
+
+    def insert_reviews(self, appid: str, reviews: tuple):
+        positive_reviews, total_reviews = reviews
+        with self.lock:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO reviews(appid, positive_reviews, total_reviews, timestamp)
+                VALUES (:appid, :positive_reviews, :total_reviews, :timestamp);
+                """,
+                {
+                    "appid": appid,
+                    "positive_reviews": positive_reviews,
+                    "total_reviews": total_reviews,
+                    "timestamp": int(time.time()),
+                },
+            )
+            self.connection.commit()
+
+    def format_lookup_stats(self) -> str:
+        return ", ".join(f"{store}: {hits} hits, {misses} misses"
+                         for store, (hits, misses) in self.lookup_stats.items())
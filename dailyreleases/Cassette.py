@@ -0,0 +1,166 @@
+"""Records HTTP responses to disk and replays them without the network"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .RateLimiter import RateLimitedAdapter, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# The recorded body is already decoded and complete
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+
+def request_key(request: requests.PreparedRequest) -> str:
+    """
+    Identify a request by its method, url and body. Query parameters are
+    sorted, so their order doesn't matter.
+    """
+    url = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else "-"
+    return f"{request.method} {urlunsplit(url._replace(query=query))} {digest}"
+
+
+class Cassette:
+    """
+    Responses are stored by request in the order they were received, and
+    replayed in the same order. Bodies are compressed and stored once, no
+    matter how often they were received.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        self.lock = threading.Lock()
+        # Responses replayed of every request so far
+        self.replayed = Counter()
+        self.setup()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS
+                bodies (hash TEXT PRIMARY KEY,
+                        data BLOB) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS
+                responses (key TEXT,
+                           seq INTEGER,
+                           status INTEGER,
+                           reason TEXT,
+                           headers TEXT,
+                           hash TEXT REFERENCES bodies (hash),
+                           elapsed REAL,
+                           PRIMARY KEY (key, seq)) WITHOUT ROWID;
+                """
+            )
+
+    def record(self, key: str, response: requests.Response):
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in DROPPED_HEADERS}
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO bodies(hash, data) VALUES (:hash, :data);",
+                {"hash": digest, "data": zlib.compress(body)},
+            )
+            self.connection.execute(
+                """
+                INSERT INTO responses(key, seq, status, reason, headers, hash, elapsed)
+                SELECT :key, COALESCE(MAX(seq), 0) + 1, :status, :reason,
+                       :headers, :hash, :elapsed
+                FROM responses WHERE key = :key;
+                """,
+                {"key": key, "status": response.status_code,
+                 "reason": response.reason, "headers": json.dumps(headers),
+                 "hash": digest, "elapsed": response.elapsed.total_seconds()},
+            )
+
+    def replay(self, key: str) -> Optional[sqlite3.Row]:
+        """
+        Return the next recorded response to `key`. Once all were replayed,
+        the last one is returned again.
+        """
+        with self.lock:
+            self.replayed[key] += 1
+            return self.connection.execute(
+                """
+                SELECT status, reason, headers, data, elapsed
+                FROM responses JOIN bodies USING (hash)
+                WHERE key = :key AND seq <= :seq
+                ORDER BY seq DESC LIMIT 1;
+                """,
+                {"key": key, "seq": self.replayed[key]},
+            ).fetchone()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CassetteAdapter(RateLimitedAdapter):
+    """
+    Transport adapter that records every response while sending requests as
+    usual, or replays them without touching the network.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, limiter: RateLimiter,
+                 latency: Optional[float] = None, **kwargs):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}")
+        self.cassette = cassette
+        self.mode = mode
+        # Seconds to wait before replaying a response, None for as long as
+        # the recorded one took
+        self.latency = latency
+        super().__init__(limiter, **kwargs)
+
+    def send(self, request, **kwargs):
+        key = request_key(request)
+        if self.mode == "record":
+            response = super().send(request, **kwargs)
+            self.cassette.record(key, response)
+            return response
+
+        row = self.cassette.replay(key)
+        if row is None:
+            raise requests.ConnectionError(f"No recorded response for {key}",
+                                           request=request)
+        time.sleep(row["elapsed"] if self.latency is None else self.latency)
+        return self.build_replayed(request, row)
+
+    @staticmethod
+    def build_replayed(request: requests.PreparedRequest,
+                       row: sqlite3.Row) -> requests.Response:
+        response = requests.Response()
+        response.status_code = row["status"]
+        response.reason = row["reason"]
+        response.headers = CaseInsensitiveDict(json.loads(row["headers"]))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = zlib.decompress(row["data"])
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=row["elapsed"])
+        return response
@@ -0,0 +1,78 @@
+"""Progress of a run, saved so a restarted process can resume it"""
+
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    def __init__(self, path: Path):
+        self.path = path
+        self.state = {}
+
+    def load(self) -> dict:
+        try:
+            with self.path.open() as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return {}
+
+    def save(self):
+        # Written to a temporary file first, so a crash never leaves half a
+        # checkpoint behind
+        tmp_path = Path(f"{self.path}.tmp")
+        with tmp_path.open("w") as file:
+            json.dump(self.state, file)
+        os.replace(tmp_path, self.path)
+
+    def start(self, run_id: str, **parameters) -> bool:
+        """
+        Resume the unfinished run `run_id`, or start it over. Returns whether
+        the run was resumed.
+        """
+        state = self.load()
+        if state.get("run_id") == run_id and not state.get("finished"):
+            self.state = state
+            return True
+        if state and not state.get("finished"):
+            logger.warning(f"Abandoning unfinished run {state.get('run_id')}")
+
+        # Tells this run apart from later runs with the same id, which a
+        # resume keeps
+        self.state = {"run_id": run_id, "nonce": uuid.uuid4().hex,
+                      "parameters": parameters, "stages": {}, "finished": False}
+        self.save()
+        return False
+
+    @property
+    def run_key(self) -> str:
+        """Identifies this run, the same after resuming it"""
+        nonce = self.state.get("nonce")
+        # Runs started before nonces existed resume with their old key
+        return f"{self.state['run_id']}/{nonce}" if nonce else self.state["run_id"]
+
+    @property
+    def parameters(self) -> dict:
+        return self.state["parameters"]
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.state["stages"]
+
+    def output(self, stage: str) -> Any:
+        return self.state["stages"][stage]
+
+    def complete(self, stage: str, output: Any = None):
+        self.state["stages"][stage] = output
+        self.save()
+
+    def finish(self):
+        self.state["finished"] = True
+        self.save()
@@ -1,8 +1,11 @@
 """Custom config class to collect important configurations"""
 
 import configparser
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
 import shutil
 from pathlib import Path
 
@@ -16,6 +19,7 @@ class Config:
         self.DATA_DIR = Path.home().joinpath(".dailyreleases")
         self.CONFIG_FILE = self.DATA_DIR.joinpath("config.ini")
         self.CONFIG = self.read_config()
+        self.log_listener = None
 
     def read_config(self) -> configparser:
         """
@@ -72,8 +76,25 @@ class Config:
         file.parent.mkdir(exist_ok=True)
         logging.config.dictConfig(self.logging_config(file, level,
                                                       backup_count))
+
+        # Records are only put on a queue by the threads that log them, the
+        # handlers that write them out run on the listener's thread
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        for handler in handlers:
+            root.removeHandler(handler)
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.log_listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True)
+        self.log_listener.start()
+        atexit.register(self.log_listener.stop)
         logger.info("Logging level is %s", level)
 
+    def add_log_handler(self, handler: logging.Handler):
+        """Add a handler to the ones writing out the queued log records"""
+        self.log_listener.handlers = self.log_listener.handlers + (handler,)
+
 
 CONFIG = Config()
 CONFIG.initialize_logging()
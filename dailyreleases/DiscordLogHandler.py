@@ -0,0 +1,122 @@
+"""Sends log records to a Discord webhook in batches, off the logging thread"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Deque, Optional, Tuple
+
+from discord_webhook import DiscordWebhook
+
+from .RateLimiter import parse_retry_after
+
+# Discord rejects longer message contents
+MAX_CONTENT_LENGTH = 2000
+
+
+class DiscordLogHandler(logging.Handler):
+    """
+    Records are only buffered by emit, a background thread joins them into
+    as few messages as possible and sends at most one every `interval`
+    seconds. When Discord can't keep up the buffer fills and the oldest
+    records are dropped, which the next message mentions.
+    """
+
+    def __init__(self, url: str, interval: float = 2, capacity: int = 1000,
+                 level=logging.NOTSET):
+        super().__init__(level)
+        self.url = url
+        self.interval = interval
+        self.records: Deque[str] = collections.deque(maxlen=capacity)
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+        self.next_send = 0.0
+        # The webhook library logs its own failures, which would otherwise
+        # come right back here
+        self.addFilter(lambda record: not record.name.startswith("discord_webhook"))
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(message) > MAX_CONTENT_LENGTH:
+            message = message[:MAX_CONTENT_LENGTH - 3] + "..."
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(message)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True,
+                                               name="discord-log")
+                self.thread.start()
+            self.condition.notify()
+
+    def take_batch(self) -> Tuple[Optional[str], int]:
+        """
+        Remove as many records as fit in one message and join them. Returns
+        the message and the number of records it stands for.
+        """
+        with self.condition:
+            if not self.records and not self.dropped:
+                return None, 0
+            lines = []
+            count = self.dropped
+            if self.dropped:
+                lines.append(f"({self.dropped} log records dropped)")
+                self.dropped = 0
+            length = len(lines[0]) if lines else -1
+            while self.records and length + 1 + len(self.records[0]) <= MAX_CONTENT_LENGTH:
+                line = self.records.popleft()
+                lines.append(line)
+                length += 1 + len(line)
+                count += 1
+            return "\n".join(lines), count
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.records and not self.dropped and not self.closed:
+                    self.condition.wait()
+                # Batches grow while waiting for the next send. Once closed,
+                # the rest is sent right away
+                while not self.closed and time.monotonic() < self.next_send:
+                    self.condition.wait(self.next_send - time.monotonic())
+                if self.closed and not self.records:
+                    return
+            content, count = self.take_batch()
+            if content is None:
+                continue
+
+            retry_after = None
+            try:
+                response = self.send(content)
+                if response.status_code == 429:
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After"))
+                response.raise_for_status()
+            except Exception:
+                with self.condition:
+                    self.dropped += count
+            self.next_send = time.monotonic() + max(self.interval,
+                                                    retry_after or 0)
+
+    def send(self, content: str):
+        webhook = DiscordWebhook(url=self.url, content=content, wait=True,
+                                 timeout=10)
+        return webhook.execute()
+
+    def close(self):
+        """Send what is still buffered, waiting at most a few seconds"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout=10)
+        super().close()
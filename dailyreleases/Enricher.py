@@ -0,0 +1,164 @@
+"""The enricher looks up releases in the stores concurrently"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List
+
+from .Pre import Pre
+from .Cache import Cache
+from .Config import CONFIG
+from .Metrics import STORE_SEARCH_SECONDS
+from .stores.StoreHandler import StoreHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Enricher:
+    def __init__(self, store_handler: StoreHandler, cache: Cache):
+        self.store_handler = store_handler
+        self.cache = cache
+        self.workers = CONFIG.CONFIG.getint("stores", "workers", fallback=8)
+        # Review lookups hit the Steam store as well, so they share its limit
+        steam_limit = threading.BoundedSemaphore(
+            CONFIG.CONFIG.getint("stores", "steam_concurrency", fallback=4))
+        self.limits = {
+            "steam": steam_limit,
+            "reviews": steam_limit,
+            "gog": threading.BoundedSemaphore(
+                CONFIG.CONFIG.getint("stores", "gog_concurrency", fallback=2)),
+            "epic": threading.BoundedSemaphore(
+                CONFIG.CONFIG.getint("stores", "epic_concurrency", fallback=2)),
+        }
+        self.lock = threading.Lock()
+        self.store_times = {}
+        self.stale_appids = set()
+
+    def timed(self, store: str, func, *args):
+        """
+        Call `func` within the concurrency limit of `store` and record the
+        wall time spanned by all calls to that store.
+        """
+        with self.limits[store]:
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                end = time.perf_counter()
+                STORE_SEARCH_SECONDS.observe(end - start, store=store)
+                with self.lock:
+                    first, last = self.store_times.get(store, (start, end))
+                    self.store_times[store] = (min(first, start), max(last, end))
+
+    def format_times(self) -> str:
+        return ", ".join(f"{store}: {last - first:.1f}s"
+                         for store, (first, last) in self.store_times.items())
+
+    def search(self, store: str, search_func, game_name: str):
+        """
+        Search `store` for `game_name`, unless the store is mirrored locally
+        or the result of an earlier search is still cached. Only searches
+        that succeeded are cached, failed ones raise.
+        """
+        catalog = self.store_handler.catalog
+        if catalog is not None and catalog.has(store):
+            # Resolved offline against the local mirror of the store
+            return self.timed(store, catalog.resolve, store, game_name)
+
+        hit, link = self.cache.get_lookup(store, game_name)
+        if hit:
+            return link
+
+        link = self.timed(store, search_func, game_name)
+        self.cache.insert_lookup(store, game_name, link)
+        return link
+
+    def enrich_steam(self, pre: Pre):
+        steam = self.store_handler.steam
+        pre.steam_link = self.search("steam", steam.search, pre.game_name)
+        if pre.steam_link is None:
+            return
+
+        appid = re.search(r"/(\d+)/?$", pre.steam_link).group(1)
+        cached = self.cache.get_reviews(appid)
+        if cached is None:
+            bundled_reviews = self.fetch_reviews(appid)
+        else:
+            # Review counts change slowly, so stale ones are good enough for
+            # this post and only refreshed once it has been published
+            bundled_reviews, fresh = cached
+            if not fresh:
+                with self.lock:
+                    self.stale_appids.add(appid)
+        if bundled_reviews is not None:
+            pre.positive_reviews, pre.total_reviews = bundled_reviews
+
+    def fetch_reviews(self, appid: str):
+        steam = self.store_handler.steam
+        bundled_reviews = self.timed("reviews", steam.get_appreviews, appid)
+        if bundled_reviews is not None:
+            self.cache.insert_reviews(appid, bundled_reviews)
+        return bundled_reviews
+
+    def refresh_reviews(self):
+        """Refetch the stale reviews that were served during `enrich`"""
+        with self.lock:
+            appids = sorted(self.stale_appids)
+            self.stale_appids.clear()
+        if not appids:
+            return
+
+        logger.info("Refreshing %s stale Steam reviews", len(appids))
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="reviews") as executor:
+            list(executor.map(self.fetch_reviews, appids))
+
+    def enrich_gog(self, pre: Pre):
+        gog = self.store_handler.gog
+        pre.gog_link = self.search("gog", gog.search, pre.game_name)
+
+    def enrich_epic(self, pre: Pre):
+        epic = self.store_handler.epic
+        pre.epic_link = self.search("epic", epic.search, pre.game_name)
+
+    def enrich(self, pres: List[Pre], on_enriched: Callable[[Pre], None] = None):
+        """
+        Look up store links and reviews for all pres. Every pre is only ever
+        modified in place, so the order of `pres` is left untouched. If given,
+        `on_enriched` is called with every pre as soon as all its lookups
+        succeeded, so they aren't lost if another lookup fails.
+        """
+        self.store_times = {}
+        self.cache.lookup_stats = {}
+        logger.info("Looking up %s releases in stores using %s workers",
+                    len(pres), self.workers)
+
+        executor = ThreadPoolExecutor(max_workers=self.workers,
+                                      thread_name_prefix="enrich")
+        futures = []
+        lookups = (self.enrich_steam, self.enrich_gog, self.enrich_epic)
+        remaining = [len(lookups)] * len(pres)
+
+        def lookup_done(i, future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            with self.lock:
+                remaining[i] -= 1
+                enriched = remaining[i] == 0
+            if enriched and on_enriched is not None:
+                on_enriched(pres[i])
+
+        try:
+            for i, pre in enumerate(pres):
+                for lookup in lookups:
+                    future = executor.submit(lookup, pre)
+                    future.add_done_callback(partial(lookup_done, i))
+                    futures.append(future)
+            for future in futures:
+                future.result()
+        finally:
+            # Don't keep hammering the stores if a lookup failed
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,108 +1,137 @@
 """Generator is used to compile functions to generate a reddit post"""
 
+import hashlib
 import inspect
 import logging
-import textwrap
 import time
-import re
-from typing import List
-from datetime import datetime, timedelta
-from discord_webhook import DiscordWebhook
+from typing import List, Tuple
+from datetime import date, datetime, timedelta
 
 from . import util
 from .PREdbs import PREdbs
 from .Cache import Cache
-from .Pre import Pre
+from .Checkpoint import Checkpoint
+from .Pre import Pre, day_bounds
+from .parsing import ReleaseType
 from .Config import CONFIG
+from .Enricher import Enricher
+from .LiveUpdate import LiveUpdate
+from .Metrics import (LAST_RUN, METRICS, RENDER_SECONDS, RENDERED_ROWS,
+                      RUN_SECONDS, STAGE_SECONDS)
+from .Outbox import Outbox
+from .RateLimiter import RATE_LIMITER
+from .NfoBackup import NfoBackup
 from .stores.StoreHandler import StoreHandler
 
 logger = logging.getLogger(__name__)
 
+# Tables of the post in order with their headers
+POST_SECTIONS = (
+    (ReleaseType.GAME, "| Game | Group | Stores | Review |"),
+    (ReleaseType.UPDATE, "| Update | Group | Stores | Reviews |"),
+    (ReleaseType.DLC, "| DLC | Group | Stores | Reviews |"),
+)
+
 
 class Generator:
     def __init__(self):
         self.store_handler = StoreHandler()
-        self.predb_handler = PREdbs()
         self.cache = Cache()
+        self.predb_handler = PREdbs(self.cache)
+        self.enricher = Enricher(self.store_handler, self.cache)
+        # Rendered rows by release and enrichment state
+        self.rendered_rows = {}
+        self.used_rows = {}
+        self.checkpoint = Checkpoint(CONFIG.DATA_DIR.joinpath("run.json"))
+        self.stage_attempts = CONFIG.CONFIG.getint("main", "retry",
+                                                   fallback=3)
+        self.stage_retry_delay = CONFIG.CONFIG.getint(
+            "main", "retry_delay", fallback=30)
+        self.outbox = Outbox()
+        self.live_update = None
+        if CONFIG.CONFIG.getboolean("discord", "live_updates", fallback=False):
+            self.live_update = LiveUpdate(
+                CONFIG.CONFIG["discord"]["webhook_url"],
+                CONFIG.DATA_DIR.joinpath("live_update.json"))
+        self.nfo_backup = None
+        if CONFIG.CONFIG.getboolean("main", "backup_nfos", fallback=False):
+            self.nfo_backup = NfoBackup()
 
-    def remove_duplicate_lines(self, input_string):
-        # Split the input string into lines
-        lines = input_string.splitlines()
+    def warm_up(self):
+        """Connect to all APIs used while generating ahead of time"""
+        steam = self.store_handler.steam
+        self.predb_handler.warm_up([
+            self.predb_handler.xrel_scene_api,
+            self.predb_handler.xrel_p2p_api,
+            self.predb_handler.predb_api,
+            steam.search_api,
+            steam.appreview_api,
+            self.store_handler.gog.games_api,
+            CONFIG.CONFIG["main"]["egs_offeridapi_url"],
+            CONFIG.CONFIG["discord"]["webhook_url"],
+        ])
+        epic = self.store_handler.epic
+        epic.warm_up([epic.graphql_api])
 
-        # Set to track lines that have been seen
+    @staticmethod
+    def remove_duplicate_lines(lines: List[str]) -> List[str]:
+        # Separators and table alignment rows are repeated on purpose
+        exception_lines = {'| :---- | :---- | :---- | :---- |', '&nbsp;', ''}
         seen_lines = set()
-
-        # Define exception lines that should be ignored
-        exception_lines = ['| :---- | :---- | :---- | :---- |', '&nbsp;', '']
-
-        # List to hold non-duplicate lines
         result_lines = []
-
-        # Count of total duplicate lines removed
-        total_duplicates_removed = 0
-
-        # Iterate through each line in the input string
         for line in lines:
-            # Strip leading and trailing whitespace
             stripped_line = line.strip()
-
-            # Check if the stripped line is in exception_lines
             if stripped_line in exception_lines:
                 result_lines.append(line)
-                continue # Skip this line and move to the next iteration
+            elif stripped_line not in seen_lines:
+                seen_lines.add(stripped_line)
+                result_lines.append(line)
+
+        logger.debug(f"Removed {len(lines) - len(result_lines)} duplicate lines")
+        return result_lines
 
-            # Check if the stripped line has been seen before
-            if stripped_line in seen_lines:
-                total_duplicates_removed += 1  # Increment total duplicates removed count
-            else:
-                seen_lines.add(stripped_line)  # Add stripped line to seen_lines
-                result_lines.append(line)  # Add non-stripped line to result_lines
+    def render_row(self, pre: Pre) -> str:
+        """
+        Render the table row of `pre`. Rows are only rendered again once the
+        release was enriched differently.
+        """
+        key = (pre.dirname, pre.group_name, pre.steam_link, pre.gog_link,
+               pre.epic_link, pre.positive_reviews, pre.total_reviews)
+        row = self.rendered_rows.get(key)
+        if row is None:
+            row = pre.to_reddit_row()
+            RENDERED_ROWS.inc(result="rendered")
+        else:
+            RENDERED_ROWS.inc(result="cached")
+        self.used_rows[key] = row
+        return row
 
-        logger.debug(f"Removed {total_duplicates_removed} duplicate lines")
-        return '\n'.join(result_lines)
+    def render_rows(self, pres: List[Pre]) -> List[Tuple[ReleaseType, str]]:
+        """Render the rows of `pres` in the order of the post"""
+        self.used_rows = {}
+        rows = []
+        for release_type, _ in POST_SECTIONS:
+            section = sorted((pre for pre in pres
+                              if pre.release_type == release_type),
+                             key=lambda pre: pre.group_name)
+            rows.extend((release_type, self.render_row(pre))
+                        for pre in section)
+        # Rows of releases that are no longer posted are dropped
+        self.rendered_rows = self.used_rows
+        return rows
 
     def generate_post(self, pres: List[Pre]) -> str:
         post = []
-        update_releases = []
-        dlc_releases = []
-        game_releases = []
-
-        for pre in pres:
-            if pre.release_type == "update":
-                update_releases.append(pre)
-            elif pre.release_type == "dlc":
-                dlc_releases.append(pre)
-            elif pre.release_type == "game":
-                game_releases.append(pre)
-
-        game_releases = sorted(game_releases, key=lambda pre: pre.group_name)
-        update_releases = sorted(update_releases, key=lambda pre: pre.group_name)
-        dlc_releases = sorted(dlc_releases, key=lambda pre: pre.group_name)
-
-        if game_releases:
-            post.append("| Game | Group | Stores | Review |")
-            post.append("| :---- | :---- | :---- | :---- |")
-            for pre in game_releases:
-                post.append(pre.to_reddit_row())
-            post.append("")
-            post.append("&nbsp;")
-            post.append("")
-        if update_releases:
-            post.append("| Update | Group | Stores | Reviews |")
-            post.append("| :---- | :---- | :---- | :---- |")
-            for pre in update_releases:
-                post.append(pre.to_reddit_row())
-            post.append("")
-            post.append("&nbsp;")
-            post.append("")
-        if dlc_releases:
-            post.append("| DLC | Group | Stores | Reviews |")
-            post.append("| :---- | :---- | :---- | :---- |")
-            for pre in dlc_releases:
-                post.append(pre.to_reddit_row())
-            post.append("")
-            post.append("&nbsp;")
-            post.append("")
+        rows = self.render_rows(pres)
+        for release_type, header in POST_SECTIONS:
+            section = [row for row_type, row in rows if row_type == release_type]
+            if section:
+                post.append(header)
+                post.append("| :---- | :---- | :---- | :---- |")
+                post.extend(section)
+                post.append("")
+                post.append("&nbsp;")
+                post.append("")
 
         if not post:
             logger.warning("Post is empty!")
@@ -117,63 +146,219 @@ class Generator:
         except FileNotFoundError:
             logger.info("No epilogue.txt")
 
-        # Convert post list to string
-        post_str = "\n".join(post)
-        post_str = self.remove_duplicate_lines(post_str)
+        # Duplicates are removed line by line instead of from the joined post
+        post_str = "\n".join(self.remove_duplicate_lines(post))
 
         logger.debug("Generated post:\n%s", post_str)
         return post_str
 
-    @util.retry(attempts=int(CONFIG.CONFIG['main']['retry']), delay=120)
-    def generate(self, discord_post=False, pm_recipients=None) -> None:
+    def ingest(self, today_bounds: Tuple[float, float],
+               yesterday_bounds: Tuple[float, float]):
+        """Cache the new pres from today and yesterday"""
+        pres = self.predb_handler.get_pres()
+        if self.nfo_backup is not None:
+            # Doesn't hold up generating the post
+            self.nfo_backup.backup(pres)
+        self.cache.insert_pres([
+            pre for pre in pres
+            if pre.from_today(today_bounds) or pre.from_yesterday(yesterday_bounds)
+        ])
+
+    def enrich_pending(self, pres: List[Pre]):
+        """Enrich the pres that weren't enriched while polling"""
+        pending_pres = [pre for pre in pres if not pre.enriched]
+        logger.info("%s of %s releases were enriched before",
+                    len(pres) - len(pending_pres), len(pres))
+        self.enricher.enrich(pending_pres, on_enriched=self.store_enrichment)
+        logger.info("Store lookup cache: %s", self.cache.format_lookup_stats())
+
+    def store_enrichment(self, pre: Pre):
+        # Stored one by one, so a failed lookup only has to be redone for
+        # the releases it failed for
+        self.cache.update_enrichment([pre])
+        pre.enriched = True
+
+    def poll(self):
+        """
+        Ingest and enrich the releases since the last poll, so generating the
+        post only has to render the releases that are already enriched.
+        """
+        if self.store_handler.catalog is not None:
+            self.store_handler.catalog.refresh(only_missing=True)
+
+        today = datetime.now().date()
+        today_bounds = day_bounds(today)
+        yesterday_bounds = day_bounds(today - timedelta(days=1))
+        self.ingest(today_bounds, yesterday_bounds)
+        pres = self.cache.get_pres_to_post(today_bounds, yesterday_bounds)
+        self.enrich_pending(pres)
+        if self.live_update is not None:
+            rows = [row for _, row in self.render_rows(pres)]
+            try:
+                self.live_update.publish(
+                    f"Daily Releases ({today.strftime('%B %d, %Y')})", rows)
+            except Exception as e:
+                logger.exception(e)
+                logger.warning("Failed to publish live update")
+        self.predb_handler.commit_watermarks()
+        self.enricher.refresh_reviews()
+        self.export_metrics()
+
+    def export_metrics(self):
+        """Write the metrics for the Prometheus node exporter's textfile collector"""
+        textfile = CONFIG.CONFIG.get("metrics", "textfile",
+                                     fallback="metrics.prom")
+        if not textfile:
+            return
+        try:
+            METRICS.write(CONFIG.DATA_DIR.joinpath(textfile))
+        except OSError as e:
+            logger.warning(f"Failed to write metrics: {e}")
+
+    def poll_interval(self, when: datetime) -> float:
+        """
+        Return the number of seconds to wait before the next poll. Hours in
+        which most releases were pred during the last days are polled most
+        often.
+        """
+        min_interval = CONFIG.CONFIG.getint("polling", "min_interval",
+                                            fallback=300)
+        max_interval = CONFIG.CONFIG.getint("polling", "max_interval",
+                                            fallback=3600)
+        counts = self.cache.get_hourly_counts()
+        if not any(counts):
+            return min_interval
+        busyness = counts[when.hour] / max(counts)
+        return max_interval - (max_interval - min_interval) * busyness
+
+    def run_stage(self, stage: str, func, *args):
+        """
+        Run `stage` of the current run, unless it already completed before a
+        restart. Only the failed stage is retried.
+        """
+        if self.checkpoint.is_done(stage):
+            logger.info(f"Stage {stage} already completed, resuming after it")
+            return self.checkpoint.output(stage)
+
+        logger.info(f"Running stage {stage}")
+        start = time.perf_counter()
+        output = util.retry(attempts=self.stage_attempts,
+                            delay=self.stage_retry_delay)(func)(*args)
+        STAGE_SECONDS.set(time.perf_counter() - start, stage=stage)
+        self.checkpoint.complete(stage, output)
+        return output
+
+    def stage_ingest(self, today_bounds, yesterday_bounds) -> dict:
+        if self.store_handler.catalog is not None:
+            # Stale mirrors are refreshed after posting, only build new ones
+            self.store_handler.catalog.refresh(only_missing=True)
+        self.ingest(today_bounds, yesterday_bounds)
+        # Committed once the releases have been published
+        return dict(self.predb_handler.watermarks)
+
+    def stage_filter(self, today_bounds, yesterday_bounds) -> List[str]:
+        pres = self.cache.get_pres_to_post(today_bounds, yesterday_bounds)
+        return [pre.dirname for pre in pres]
+
+    def stage_enrich(self, dirnames: List[str]):
+        self.enrich_pending(self.cache.get_pres_by_dirnames(dirnames))
+
+    def stage_render(self, dirnames: List[str]) -> str:
+        pres = self.cache.get_pres_by_dirnames(dirnames)
+        with RENDER_SECONDS.time():
+            return self.generate_post(pres)
+
+    @staticmethod
+    def message_key(run_key: str, kind: str, destination: str) -> str:
+        # Webhook urls contain their token, so only a digest goes in the key
+        digest = hashlib.sha256(destination.encode()).hexdigest()[:16]
+        return f"{run_key}/{kind}/{digest}"
+
+    def stage_publish(self, run_key: str, title: str, post: str,
+                      dirnames: List[str], discord_post: bool,
+                      notify_urls: List[str]):
+        if discord_post:
+            # Delivered by the outbox in the background. A retried or resumed
+            # publish queues the same keys, which are never sent twice, while
+            # a new run of the same day gets new ones.
+            for url in self.webhook_urls():
+                self.outbox.put(self.message_key(run_key, "post", url), url,
+                                title, post.encode(), title + ".txt")
+            for url in notify_urls:
+                self.outbox.put(self.message_key(run_key, "notify", url), url,
+                                f"{title} is out with {len(dirnames)} releases")
+            self.outbox.start()
+
+        self.cache.mark_posted(self.cache.get_pres_by_dirnames(dirnames))
+        self.predb_handler.commit_watermarks()
+
+    def stage_maintain(self):
+        self.enricher.refresh_reviews()
+        if self.store_handler.catalog is not None:
+            self.store_handler.catalog.refresh()
+        self.cache.clean()
+
+    @staticmethod
+    def run_id(discord_post: bool) -> str:
+        # Runs of test mode never resume runs that post, or vice versa
+        post_date = (datetime.utcnow() - timedelta(hours=12)).date()
+        return post_date.isoformat() + ("" if discord_post else "-test")
+
+    def has_unfinished_run(self, discord_post: bool) -> bool:
+        state = self.checkpoint.load()
+        return (state.get("run_id") == self.run_id(discord_post)
+                and not state.get("finished"))
+
+    @staticmethod
+    def webhook_urls() -> List[str]:
+        discord_config = CONFIG.CONFIG["discord"]
+        extra_urls = discord_config.get("extra_webhook_urls", fallback="")
+        return [discord_config["webhook_url"]] + util.split_config_list(extra_urls)
+
+    def generate(self, discord_post=False, notify_urls: List[str] = None) -> None:
         logger.info(
             "-------------------------------------------------------------------------------------------------"
         )
         start_time = time.time()
 
-        pres = self.predb_handler.get_pres()
-        relevant_pres = []
-        
-        for pre in pres:
-            if pre.from_today() is True:
-                relevant_pres.append(pre)
-            elif pre.from_yesterday() is True and self.cache.get_pre_by_dirname(pre.dirname) is None:
-                # This branch checks if a pre was missed the day before
-                relevant_pres.append(pre)
-            else:
-                continue
-
-        for pre in relevant_pres:
-            self.cache.insert_pre(pre)
-            pre.steam_link = self.store_handler.steam.search(pre.game_name)
-            pre.gog_link = self.store_handler.gog.search(pre.game_name)
-            pre.epic_link = self.store_handler.epic.search(pre.game_name)
-
-            if pre.steam_link is not None:
-                match = re.search(r"/(\d+)/?$", pre.steam_link)
-                appid = match.group(1)
-                bundled_reviews = self.store_handler.steam.get_appreviews(appid)
-                if bundled_reviews is not None:
-                    positive_reviews, total_reviews = bundled_reviews
-                    pre.positive_reviews = positive_reviews
-                    pre.total_reviews = total_reviews
-                
-            
         # The date of the post changes at midday instead of midnight to allow calling script after 00:00
-        title = f"Daily Releases ({(datetime.utcnow() - timedelta(hours=12)).strftime('%B %d, %Y')})"
-
-        generated_post = self.generate_post(relevant_pres)
-        generated_post_src = textwrap.indent(generated_post, "    ")
+        post_date = datetime.utcnow() - timedelta(hours=12)
+        title = f"Daily Releases ({post_date.strftime('%B %d, %Y')})"
+        resumed = self.checkpoint.start(self.run_id(discord_post),
+                                        today=datetime.now().date().isoformat())
+        if resumed:
+            logger.info("Resuming unfinished run of %s", title)
+        # A resumed run posts the same days as it would have
+        today = date.fromisoformat(self.checkpoint.parameters["today"])
+        today_bounds = day_bounds(today)
+        yesterday_bounds = day_bounds(today - timedelta(days=1))
 
-        if discord_post:
-            # post to discord
-            webhook_url = CONFIG.CONFIG["discord"]["webhook_url"]
-            webhook = DiscordWebhook(url=webhook_url, content=title)
-            webhook.add_file(generated_post.encode(), filename=title + '.txt')
-            webhook.execute()
+        watermarks = self.run_stage("ingest", self.stage_ingest,
+                                    today_bounds, yesterday_bounds)
+        self.predb_handler.watermarks.update(watermarks)
+        dirnames = self.run_stage("filter", self.stage_filter,
+                                  today_bounds, yesterday_bounds)
+        self.run_stage("enrich", self.stage_enrich, dirnames)
+        post = self.run_stage("render", self.stage_render, dirnames)
+        if notify_urls is None:
+            notify_urls = util.split_config_list(CONFIG.CONFIG.get(
+                "discord", "notify_webhook_urls", fallback=""))
+        self.run_stage("publish", self.stage_publish,
+                       self.checkpoint.run_key, title, post, dirnames,
+                       discord_post, notify_urls)
+        try:
+            self.run_stage("maintain", self.stage_maintain)
+        except Exception as e:
+            # The post is out, cleaning up is tried again next run
+            logger.exception(e)
+        self.checkpoint.finish()
 
-        self.cache.clean()
-        logger.info("Execution took %s seconds", int(time.time() - start_time))
+        RUN_SECONDS.set(time.time() - start_time)
+        LAST_RUN.set(time.time())
+        self.export_metrics()
+        logger.info("Execution took %s seconds (%s)",
+                    int(time.time() - start_time), self.enricher.format_times())
+        logger.info("Rate limits: %s", RATE_LIMITER.format_limits())
         logger.info(
             "-------------------------------------------------------------------------------------------------"
         )
@@ -0,0 +1,77 @@
+"""Keeps a Discord message of the day's releases up to date while polling"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import List
+
+from discord_webhook import DiscordWebhook
+
+logger = logging.getLogger(__name__)
+
+# Discord rejects longer message contents
+MAX_CONTENT_LENGTH = 2000
+
+
+class LiveUpdate:
+    def __init__(self, webhook_url: str, path: Path):
+        self.webhook_url = webhook_url
+        # Message id and published rows survive restarts, so the same message
+        # keeps being edited all day
+        self.path = path
+
+    def load(self) -> dict:
+        try:
+            with self.path.open() as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, state: dict):
+        tmp_path = Path(f"{self.path}.tmp")
+        with tmp_path.open("w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def format_delta(title: str, delta: List[str], total: int) -> str:
+        content = f"**{title}**: {total} releases so far, {len(delta)} new or updated"
+        for i, row in enumerate(delta):
+            more = f"\n...and {len(delta) - i} more"
+            if len(content) + 1 + len(row) + len(more) > MAX_CONTENT_LENGTH:
+                return content + more
+            content += "\n" + row
+        return content
+
+    def publish(self, title: str, rows: List[str]) -> bool:
+        """
+        Publish the rows that are new or changed since the last update of
+        `title`. The first update sends a message, later ones edit it.
+        Returns whether anything was published.
+        """
+        state = self.load()
+        if state.get("title") != title:
+            state = {"title": title, "message_id": None, "rows": []}
+        published = set(state["rows"])
+        delta = [row for row in rows if row not in published]
+        if not delta:
+            logger.debug("No new or updated releases to publish")
+            return False
+
+        content = self.format_delta(title, delta, len(rows))
+        if state["message_id"] is None:
+            webhook = DiscordWebhook(url=self.webhook_url, content=content,
+                                     wait=True)
+            response = webhook.execute()
+            state["message_id"] = webhook.id
+        else:
+            webhook = DiscordWebhook(url=self.webhook_url, content=content,
+                                     id=state["message_id"])
+            response = webhook.edit()
+        response.raise_for_status()
+
+        logger.info(f"Published {len(delta)} new or updated releases of {title}")
+        state["rows"] = rows
+        self.save(state)
+        return True
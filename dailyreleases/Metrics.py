@@ -0,0 +1,226 @@
+"""Counters, gauges and histograms, exported in the Prometheus text format"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from cache hits to slow store APIs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"'
+                          for name, value in labels) + "}"
+
+
+def format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[Tuple[str, str], ...], object] = {}
+
+    @staticmethod
+    def key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def samples(self) -> Iterator[Tuple[str, tuple, float]]:
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield self.name, labels, value
+
+    def format(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{format_labels(labels)} {format_value(value)}"
+                     for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def get(self, **labels) -> Optional[float]:
+        with self.lock:
+            return self.values.get(self.key(labels))
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # counts per bucket, the last one is +Inf, then the sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> int:
+        with self.lock:
+            counts = self.values.get(self.key(labels))
+            return sum(counts[:-1]) if counts is not None else 0
+
+    def samples(self) -> Iterator[Tuple[str, tuple, float]]:
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       labels + (("le", format_value(bound)),), cumulative)
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def register(self, metric: Metric) -> Metric:
+        with self.lock:
+            # Registering again returns the existing metric, so modules can
+            # be reloaded
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str,
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def format(self) -> str:
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.format())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        # Written to a temporary file first, so a scraper never reads half
+        tmp_path = Path(f"{path}.tmp")
+        tmp_path.write_text(self.format(), encoding="utf-8")
+        os.replace(tmp_path, path)
+        logger.debug(f"Wrote metrics to {path}")
+
+    def serve(self, host: str, port: int):
+        """Serve the metrics at http://host:port/metrics in the background"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.format().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True,
+                         name="metrics").start()
+        logger.info(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+
+METRICS = Registry()
+
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "dailyreleases_http_request_seconds", "Time to get responses by host")
+HTTP_REQUESTS = METRICS.counter(
+    "dailyreleases_http_requests_total", "Requests sent by host and status")
+STORE_SEARCH_SECONDS = METRICS.histogram(
+    "dailyreleases_store_search_seconds", "Time of store searches by store")
+PREDB_FETCH_SECONDS = METRICS.histogram(
+    "dailyreleases_predb_fetch_seconds", "Time to get new releases by PREdb source")
+PREDB_RELEASES = METRICS.counter(
+    "dailyreleases_predb_releases_total", "New releases by PREdb source")
+CACHE_LOOKUPS = METRICS.counter(
+    "dailyreleases_cache_lookups_total", "Cache lookups by cache and result")
+RENDER_SECONDS = METRICS.histogram(
+    "dailyreleases_render_seconds", "Time to render the post")
+RENDERED_ROWS = METRICS.counter(
+    "dailyreleases_rendered_rows_total", "Rows of the post by whether they were cached")
+STAGE_SECONDS = METRICS.gauge(
+    "dailyreleases_stage_seconds", "Duration of the stages of the last run")
+RUN_SECONDS = METRICS.gauge(
+    "dailyreleases_run_seconds", "Duration of the last run")
+LAST_RUN = METRICS.gauge(
+    "dailyreleases_last_run_timestamp_seconds", "Time the last run finished")
@@ -0,0 +1,190 @@
+"""Append-only, content addressed archive of compressed NFOs"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple, BinaryIO
+
+from .Config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b"DRNFOPK1"
+
+
+class NfoArchive:
+    """
+    NFOs are compressed and appended to pack files. Identical NFOs, e.g. of
+    the same release from several PREdbs, are only stored once. An index maps
+    every dirname to the offset of its NFO in a pack, so any NFO is read with
+    a single seek.
+    """
+
+    def __init__(self, archive_dir: Path = None, pack_size: int = None):
+        self.archive_dir = archive_dir or CONFIG.DATA_DIR.joinpath("nfo-archive")
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.pack_size = pack_size or CONFIG.CONFIG.getint(
+            "main", "nfo_pack_size", fallback=64) * 1024 * 1024
+        connection = sqlite3.connect(self.archive_dir.joinpath("index.sqlite"),
+                                     check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        self.lock = threading.RLock()
+        self.readers: Dict[int, BinaryIO] = {}
+        self.setup()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS
+                blobs (hash TEXT PRIMARY KEY,
+                       pack INTEGER,
+                       offset INTEGER,
+                       length INTEGER,
+                       size INTEGER) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS
+                nfos (dirname TEXT PRIMARY KEY,
+                      hash TEXT REFERENCES blobs (hash),
+                      extension TEXT,
+                      timestamp INTEGER) WITHOUT ROWID;
+                """
+            )
+
+    def pack_path(self, pack: int) -> Path:
+        return self.archive_dir.joinpath(f"pack-{pack:05d}.pack")
+
+    def has(self, dirname: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM nfos WHERE dirname = :dirname;",
+                {"dirname": dirname},
+            ).fetchone()
+        return row is not None
+
+    def append(self, blob: bytes) -> Tuple[int, int]:
+        """Append `blob` to the newest pack and return the pack and offset"""
+        row = self.connection.execute("SELECT MAX(pack) FROM blobs;").fetchone()
+        pack = row[0] or 1
+        path = self.pack_path(pack)
+        # Blobs written before a crash but never indexed are just skipped
+        if path.exists() and path.stat().st_size + len(blob) > self.pack_size:
+            pack += 1
+            path = self.pack_path(pack)
+
+        with path.open("ab") as file:
+            if file.tell() == 0:
+                file.write(PACK_MAGIC)
+            offset = file.tell()
+            file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+        return pack, offset
+
+    def put(self, dirname: str, extension: str, data: bytes) -> str:
+        """Store the NFO of `dirname` and return its content hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            known = self.connection.execute(
+                "SELECT 1 FROM blobs WHERE hash = :hash;", {"hash": digest}
+            ).fetchone()
+            if known is None:
+                blob = zlib.compress(data, 9)
+                pack, offset = self.append(blob)
+            with self.connection:
+                if known is None:
+                    self.connection.execute(
+                        """
+                        INSERT INTO blobs(hash, pack, offset, length, size)
+                        VALUES (:hash, :pack, :offset, :length, :size);
+                        """,
+                        {"hash": digest, "pack": pack, "offset": offset,
+                         "length": len(blob), "size": len(data)},
+                    )
+                self.connection.execute(
+                    """
+                    INSERT OR REPLACE INTO nfos(dirname, hash, extension, timestamp)
+                    VALUES (:dirname, :hash, :extension, :timestamp);
+                    """,
+                    {"dirname": dirname, "hash": digest,
+                     "extension": extension, "timestamp": int(time.time())},
+                )
+        return digest
+
+    def get(self, dirname: str) -> Optional[Tuple[bytes, str]]:
+        """Return the NFO of `dirname` and its file extension"""
+        with self.lock:
+            row = self.connection.execute(
+                """
+                SELECT extension, pack, offset, length
+                FROM nfos JOIN blobs USING (hash)
+                WHERE dirname = :dirname;
+                """,
+                {"dirname": dirname},
+            ).fetchone()
+            if row is None:
+                return None
+
+            reader = self.readers.get(row["pack"])
+            if reader is None:
+                reader = self.pack_path(row["pack"]).open("rb")
+                self.readers[row["pack"]] = reader
+            reader.seek(row["offset"])
+            blob = reader.read(row["length"])
+        return zlib.decompress(blob), row["extension"]
+
+    def import_files(self, nfo_dir: Path, remove=False) -> Tuple[int, int]:
+        """
+        Import the loose NFO files in `nfo_dir`, as written by older versions.
+        Returns the number of imported files and of those that were duplicates.
+        """
+        imported = duplicates = 0
+        for path in sorted(nfo_dir.iterdir()):
+            if not path.is_file() or path.suffix == ".part":
+                continue
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            with self.lock:
+                duplicate = self.connection.execute(
+                    "SELECT 1 FROM blobs WHERE hash = :hash;", {"hash": digest}
+                ).fetchone() is not None
+            self.put(path.stem, path.suffix, data)
+            imported += 1
+            duplicates += duplicate
+            if remove:
+                path.unlink()
+        logger.info(f"Imported {imported} NFOs from {nfo_dir}, {duplicates} "
+                    "of them duplicates")
+        return imported, duplicates
+
+    def close(self):
+        with self.lock:
+            for reader in self.readers.values():
+                reader.close()
+            self.readers = {}
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import loose NFO files into the NFO archive")
+    parser.add_argument("nfo_dir", nargs="?", type=Path,
+                        default=CONFIG.DATA_DIR.joinpath("nfo"))
+    parser.add_argument("--remove", action="store_true",
+                        help="delete the files once they are imported")
+    args = parser.parse_args()
+
+    archive = NfoArchive()
+    imported, duplicates = archive.import_files(args.nfo_dir, remove=args.remove)
+    print(f"Imported {imported} NFOs ({duplicates} duplicates) into {archive.archive_dir}")
+
+
+if __name__ == "__main__":
+    main()
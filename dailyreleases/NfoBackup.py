@@ -0,0 +1,77 @@
+"""Backs up the NFOs of releases in the background"""
+
+import logging
+import mimetypes
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from .APIHelper import APIHelper
+from .Config import CONFIG
+from .NfoArchive import NfoArchive
+from .Pre import Pre
+
+logger = logging.getLogger(__name__)
+
+
+class NfoBackup(APIHelper):
+    def __init__(self, archive: NfoArchive = None):
+        self.archive = archive or NfoArchive()
+        self.workers = CONFIG.CONFIG.getint("main", "nfo_workers", fallback=4)
+        self.chunk_size = 64 * 1024
+        # NFOs are a few KB, anything this large isn't one
+        self.max_size = 16 * 1024 * 1024
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def backup(self, pres: List[Pre]) -> List[Future]:
+        """
+        Download the NFOs of `pres` which aren't stored yet. Downloads run in
+        the background, so this returns right away.
+        """
+        futures = []
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                   thread_name_prefix="nfo")
+            for pre in pres:
+                if not pre.nfo_link:
+                    continue
+                if pre.dirname in self.pending or self.archive.has(pre.dirname):
+                    continue
+                self.pending.add(pre.dirname)
+                futures.append(self.executor.submit(self.download, pre))
+        if futures:
+            logger.info("Backing up %s NFOs in the background", len(futures))
+        return futures
+
+    def download(self, pre: Pre):
+        try:
+            r = self.send_request(pre.nfo_link, stream=True)
+            if r is None:
+                logger.warning(f"Failed to download NFO for {pre.dirname}")
+                return
+            with r:
+                content_type = r.headers.get("Content-Type", "")
+                extension = mimetypes.guess_extension(
+                    content_type.split(";")[0].strip()) or ".nfo"
+                data = bytearray()
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    data += chunk
+                    if len(data) > self.max_size:
+                        raise ValueError(f"larger than {self.max_size} bytes")
+            digest = self.archive.put(pre.dirname, extension, bytes(data))
+            logger.info(f"Downloaded NFO for {pre.dirname} ({digest[:12]})")
+        except Exception as e:
+            logger.warning(f"Failed to download NFO for {pre.dirname}: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(pre.dirname)
+
+    def wait(self):
+        """Wait for all downloads that are still running"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,249 @@
+"""Durable queue of posts and notifications, delivered in the background"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from discord_webhook import DiscordWebhook
+
+from .Config import CONFIG
+from .RateLimiter import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Outbox:
+    """
+    Messages are stored before anything is sent, so they survive crashes
+    and restarts. Every message has an idempotency key, and queueing a key
+    that is known already does nothing, so a publish that is retried never
+    posts twice. Destinations are delivered to concurrently, the messages of
+    each destination in order. A failed message is retried with exponential
+    backoff and holds back the later messages to its destination only.
+    """
+
+    def __init__(self, path=None):
+        connection = sqlite3.connect(
+            path or CONFIG.DATA_DIR.joinpath("outbox.sqlite"),
+            check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        self.lock = threading.RLock()
+        self.workers = CONFIG.CONFIG.getint("outbox", "workers", fallback=4)
+        self.max_attempts = CONFIG.CONFIG.getint("outbox", "max_attempts",
+                                                 fallback=10)
+        self.retry_delay = CONFIG.CONFIG.getfloat("outbox", "retry_delay",
+                                                  fallback=30)
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.setup()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(
+                """
+                -- status is pending, sent or failed. A message that was
+                -- being sent when the process died is still pending.
+                CREATE TABLE IF NOT EXISTS
+                messages (key TEXT PRIMARY KEY,
+                          destination TEXT,
+                          content TEXT,
+                          attachment BLOB,
+                          filename TEXT,
+                          status TEXT NOT NULL DEFAULT 'pending',
+                          attempts INTEGER NOT NULL DEFAULT 0,
+                          next_attempt REAL NOT NULL DEFAULT 0,
+                          last_error TEXT,
+                          created_at REAL,
+                          sent_at REAL);
+
+                CREATE INDEX IF NOT EXISTS messages_status
+                ON messages (status, next_attempt);
+                """
+            )
+
+    def put(self, key: str, destination: str, content: str,
+            attachment: bytes = None, filename: str = None) -> bool:
+        """
+        Queue a message for `destination` unless `key` was queued before.
+        Returns whether the message was queued.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                """
+                INSERT OR IGNORE INTO messages(key, destination, content,
+                                               attachment, filename, created_at)
+                VALUES (:key, :destination, :content, :attachment, :filename,
+                        :created_at);
+                """,
+                {"key": key, "destination": destination, "content": content,
+                 "attachment": attachment, "filename": filename,
+                 "created_at": time.time()},
+            )
+        queued = cursor.rowcount > 0
+        if queued:
+            logger.debug(f"Queued message {key}")
+        else:
+            logger.warning(f"Message {key} was queued before, not queueing it again")
+        self.wake.set()
+        return queued
+
+    def get_pending(self) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.connection.execute(
+                """
+                SELECT * FROM messages
+                WHERE status = 'pending'
+                ORDER BY created_at, key;
+                """
+            ).fetchall()
+
+    def get_status(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status FROM messages WHERE key = :key;", {"key": key}
+            ).fetchone()
+        return row["status"] if row is not None else None
+
+    def count_pending(self) -> int:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM messages WHERE status = 'pending';"
+            ).fetchone()[0]
+
+    def next_attempt(self) -> Optional[float]:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT MIN(next_attempt) FROM messages WHERE status = 'pending';"
+            ).fetchone()[0]
+
+    def mark_sent(self, key: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                UPDATE messages SET status = 'sent', sent_at = :now,
+                                    attempts = attempts + 1, last_error = NULL
+                WHERE key = :key;
+                """,
+                {"key": key, "now": time.time()},
+            )
+
+    def mark_failed(self, message: sqlite3.Row, error: Exception):
+        attempts = message["attempts"] + 1
+        delay = min(self.retry_delay * 2 ** (attempts - 1), 3600)
+        if isinstance(error, DeliveryError) and error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                UPDATE messages SET status = :status, attempts = :attempts,
+                                    next_attempt = :next_attempt,
+                                    last_error = :error
+                WHERE key = :key;
+                """,
+                {"key": message["key"], "status": status, "attempts": attempts,
+                 "next_attempt": time.time() + delay, "error": str(error)},
+            )
+        if status == "failed":
+            logger.error(f"Giving up on message {message['key']} after "
+                         f"{attempts} attempts: {error}")
+        else:
+            logger.warning(f"Failed to deliver message {message['key']} "
+                           f"(attempt {attempts}/{self.max_attempts}), "
+                           f"retrying in {delay:.0f}s: {error}")
+
+    def send(self, message: sqlite3.Row):
+        """Send `message` to its destination, a Discord webhook"""
+        webhook = DiscordWebhook(url=message["destination"],
+                                 content=message["content"], wait=True,
+                                 timeout=30)
+        if message["attachment"] is not None:
+            webhook.add_file(message["attachment"], filename=message["filename"])
+        response = webhook.execute()
+        if response.status_code >= 400:
+            raise DeliveryError(
+                f"status {response.status_code}",
+                parse_retry_after(response.headers.get("Retry-After")))
+
+    def deliver_destination(self, messages: List[sqlite3.Row]):
+        for message in messages:
+            try:
+                self.send(message)
+            except Exception as e:
+                self.mark_failed(message, e)
+                # Later messages wait, so they arrive in order
+                return
+            self.mark_sent(message["key"])
+            logger.info(f"Delivered message {message['key']}")
+
+    def deliver(self) -> int:
+        """
+        Deliver all messages whose next attempt is due. Returns the number of
+        messages that were tried.
+        """
+        now = time.time()
+        by_destination = OrderedDict()
+        for message in self.get_pending():
+            by_destination.setdefault(message["destination"], []).append(message)
+        # A destination whose first message isn't due yet holds back the rest
+        batches = [messages for messages in by_destination.values()
+                   if messages[0]["next_attempt"] <= now]
+        if not batches:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="outbox") as executor:
+            list(executor.map(self.deliver_destination, batches))
+        return sum(len(messages) for messages in batches)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wake.clear()
+            try:
+                self.deliver()
+            except Exception as e:
+                logger.exception(e)
+            next_attempt = self.next_attempt()
+            timeout = 60 if next_attempt is None else max(next_attempt - time.time(), 0.1)
+            self.wake.wait(min(timeout, 60))
+
+    def start(self):
+        """Deliver messages in the background, including ones left from before"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True,
+                                           name="outbox")
+            self.thread.start()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds for the pending messages to be delivered.
+        Returns whether they all were.
+        """
+        self.start()
+        deadline = time.monotonic() + timeout
+        while self.count_pending() and time.monotonic() < deadline:
+            self.wake.set()
+            time.sleep(0.1)
+        pending = self.count_pending()
+        if pending:
+            logger.warning(f"{pending} messages are still waiting to be delivered")
+        return not pending
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
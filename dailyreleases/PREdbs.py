@@ -1,92 +1,170 @@
 """This class is used to query different PREdb APIs"""
 
 import logging
-from typing import List
-from urllib.error import HTTPError, URLError
-import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, List, Optional, Tuple
 
+from .Cache import Cache
 from .Pre import Pre
 from .Config import CONFIG
 from .APIHelper import APIHelper
+from .Metrics import PREDB_FETCH_SECONDS, PREDB_RELEASES
 
 logger = logging.getLogger(__name__)
 
 
 class PREdbs(APIHelper):
-    def __init__(self):
+    def __init__(self, cache: Cache = None):
         self.xrel_scene_api = "https://api.xrel.to/v2/release/browse_category.json"
         self.xrel_p2p_api = "https://api.xrel.to/v2/p2p/releases.json"
         self.predb_api = "https://api.predb.net/"
-
-    def download_nfo(self, nfo_link: str, dirname: str, data_dir: str):
-        try:
-            r = self.send_request(nfo_link)
-            content_type = r.content_type
-            if r.status_code == 200 and content_type:
-                extension = mimetypes.guess_extension(content_type)
-                if not extension:
-                    extension = '.nfo'
-                nfo_dir = data_dir.joinpath("nfo")
-                # Create the directory if it doesn't exist
-                nfo_dir.mkdir(parents=True, exist_ok=True)
-                nfo_filename = nfo_dir.joinpath(f"{dirname}{extension}")
-                with open(nfo_filename, "wb") as nfo_file:
-                    nfo_file.write(r.bytes)
-                    logger.info(f"Downloaded NFO for {dirname} to "
-                                f"{nfo_filename}")
-            else:
-                logger.warning(f"Failed to download NFO for {dirname}. "
-                               f"Status code: {r.status_code}")
-        except (HTTPError, URLError) as e:
-            logger.warning(f"Failed to download NFO for {dirname}: {e}")
+        self.xrel_scene_categories = ("CRACKED", "UPDATE")
+        self.timeout = CONFIG.CONFIG.getint("web", "predb_timeout",
+                                            fallback=60)
+        self.max_pages = CONFIG.CONFIG.getint("web", "predb_max_pages",
+                                              fallback=10)
+        self.overlap = CONFIG.CONFIG.getint("web", "predb_overlap",
+                                            fallback=3600)
+        # Releases older than this are never posted, so never fetched
+        self.max_age = 48 * 3600
+        self.cache = cache
+        # Watermarks of this run, only committed once the releases were posted
+        self.watermarks = {}
+        self.watermarks_lock = threading.Lock()
+
+    def get_watermark(self, source: str) -> int:
+        """
+        Return the timestamp down to which `source` has to be fetched. That is
+        the newest release seen last time minus an overlap for releases which
+        show up late, or the oldest releases that would still be posted.
+        """
+        floor = time.time() - self.max_age
+        watermark = self.cache.get_watermark(source) if self.cache else None
+        if watermark is None:
+            return floor
+        return max(watermark - self.overlap, floor)
+
+    def get_pages(self, source: str, get_page: Callable[[int], Optional[Tuple[List[Pre], bool]]]) -> Tuple[List[Pre], Optional[int]]:
+        with PREDB_FETCH_SECONDS.time(source=source):
+            releases, watermark = self.page_through(source, get_page)
+        PREDB_RELEASES.inc(len(releases), source=source)
+        return releases, watermark
+
+    def page_through(self, source: str, get_page: Callable[[int], Optional[Tuple[List[Pre], bool]]]) -> Tuple[List[Pre], Optional[int]]:
+        """
+        Page through `source` from newest to oldest releases until reaching
+        those already seen. `get_page` returns the pres of a page and whether
+        it is the last one, or None if the page couldn't be retrieved.
+
+        Returns the releases and the timestamp of the newest one, which
+        becomes the watermark of `source` once its releases were merged. The
+        timestamp is None if releases down to the old watermark may be
+        missing.
+        """
+        cutoff = self.get_watermark(source)
+        releases = {}
+        for page in range(1, self.max_pages + 1):
+            result = get_page(page)
+            if result is None:
+                # Releases between the pages we got and the watermark would
+                # be skipped next time if it moved
+                logger.warning(f"Failed to get page {page} of {source}, "
+                               "not moving its watermark")
+                return list(releases.values()), None
+            pres, last_page = result
+            new_pres = [pre for pre in pres if pre.dirname not in releases]
+            releases.update((pre.dirname, pre) for pre in new_pres
+                            if pre.timestamp >= cutoff)
+            # Sources that don't page return the same releases again
+            if last_page or not new_pres or any(pre.timestamp < cutoff for pre in pres):
+                break
+        else:
+            logger.warning(f"Stopped getting {source} after {self.max_pages} "
+                           "pages, older releases may be missing, not moving "
+                           "its watermark")
+            return list(releases.values()), None
+
+        logger.debug(f"Got {len(releases)} new releases from {source} in "
+                     f"{page} page(s)")
+        newest = max((pre.timestamp for pre in releases.values()), default=None)
+        return list(releases.values()), newest
+
+    def move_watermark(self, source: str, timestamp: Optional[int]):
+        if timestamp is None:
+            return
+        with self.watermarks_lock:
+            self.watermarks[source] = max(timestamp, self.watermarks.get(source, timestamp))
+
+    def commit_watermarks(self):
+        """Remember the newest releases seen, once they have been handled"""
+        with self.watermarks_lock:
+            if self.cache is not None and self.watermarks:
+                self.cache.set_watermarks(self.watermarks)
+            self.watermarks = {}
 
     def get_xrel_scene(self, categories=("CRACKED", "UPDATE")) -> List[Pre]:
-        logger.debug("Getting PREs from xrel.to")
+        xrel_releases = []
+        for category in categories:
+            releases, watermark = self.get_xrel_scene_category(category)
+            xrel_releases.extend(releases)
+            self.move_watermark(f"xrel.to {category}", watermark)
+        return xrel_releases
 
+    def get_xrel_scene_category(self, category: str) -> Tuple[List[Pre], Optional[int]]:
+        logger.debug(f"Getting {category} PREs from xrel.to")
+        return self.get_pages(f"xrel.to {category}", partial(
+            self.get_xrel_scene_page, category))
+
+    def get_xrel_scene_page(self, category: str, page: int) -> Optional[Tuple[List[Pre], bool]]:
         xrel_releases = []
 
-        for category in categories:
-            parameters = {
-                "category_name": category,
-                "ext_info_type": "game",
-                "per_page": 100,
-                "page": 1,
-                }
-            release_list = self.send_request(self.xrel_scene_api,
-                                             parameters)
-            if release_list is not None:
-                release_list = release_list.json().get("list")
-            else:
-                logger.error("Release list could not be retrieved.")
-                continue
+        parameters = {
+            "category_name": category,
+            "ext_info_type": "game",
+            "per_page": 100,
+            "page": page,
+            }
+        response = self.send_request(self.xrel_scene_api, parameters)
+        if response is not None:
+            response = response.json()
+        else:
+            logger.error("Release list could not be retrieved.")
+            return None
 
-            for release_info in release_list:
-                dirname = release_info["dirname"]
-                nfo_link = release_info["link_href"]
-                group = release_info["group_name"]
-                timestamp = release_info["time"]
-                xrel_releases.append(Pre(dirname, nfo_link, group, timestamp))
-                logger.info(f"Release {dirname}, NFO: {nfo_link}")
+        for release_info in response.get("list", []):
+            dirname = release_info["dirname"]
+            nfo_link = release_info["link_href"]
+            group = release_info["group_name"]
+            timestamp = release_info["time"]
+            xrel_releases.append(Pre(dirname, nfo_link, group, timestamp))
+            logger.info(f"Release {dirname}, NFO: {nfo_link}")
 
-        return xrel_releases
+        pagination = response.get("pagination", {})
+        return xrel_releases, page >= pagination.get("total_pages", page)
 
-    def get_xrel_p2p(self) -> List[Pre]:
+    def get_xrel_p2p(self) -> Tuple[List[Pre], Optional[int]]:
         logger.debug("Getting P2P pres from xrel.to")
+        return self.get_pages("xrel.to p2p", self.get_xrel_p2p_page)
 
+    def get_xrel_p2p_page(self, page: int) -> Optional[Tuple[List[Pre], bool]]:
         xrel_releases = []
 
         parameters = {
             "category_id": "015d9c029",  # game
-            "per_page": 100
+            "per_page": 100,
+            "page": page,
                       }
-        release_list = self.send_request(self.xrel_p2p_api, parameters)
-        if release_list is not None:
-            release_list = release_list.json().get("list")
+        response = self.send_request(self.xrel_p2p_api, parameters)
+        if response is not None:
+            response = response.json()
         else:
             logger.error("Release list could not be retrieved.")
-            return xrel_releases
+            return None
 
-        for release_info in release_list:
+        for release_info in response.get("list", []):
             # pprint(release_info)
             dirname = release_info["dirname"]
             nfo_link = release_info["link_href"]
@@ -97,20 +175,24 @@ class PREdbs(APIHelper):
             xrel_releases.append(Pre(dirname, nfo_link, group, timestamp))
             logger.info(f"Release {dirname}, NFO: {nfo_link}")
 
-        return xrel_releases
+        pagination = response.get("pagination", {})
+        return xrel_releases, page >= pagination.get("total_pages", page)
 
-    def get_predbde(self) -> List[Pre]:
+    def get_predbde(self) -> Tuple[List[Pre], Optional[int]]:
         logger.debug("Getting pres from predb.net")
+        return self.get_pages("predb.net", self.get_predbde_page)
+
+    def get_predbde_page(self, page: int) -> Optional[Tuple[List[Pre], bool]]:
         # Today and yesterday in case any were missed.
-        built_api = f"{self.predb_api}?section=GAMES&date=today&date=yesterday"
+        built_api = f"{self.predb_api}?section=GAMES&date=today&date=yesterday&page={page}"
 
         predb_releases = []
 
         response = self.send_request(built_api)
         if response is None:
-            return predb_releases
+            return None
         elif response.json().get("results") == 0:
-            return predb_releases
+            return predb_releases, True
 
         response = response.json()
         for rls in response.get("data"):
@@ -121,27 +203,45 @@ class PREdbs(APIHelper):
             predb_releases.append(Pre(dirname, nfo_link, group, timestamp))
             logger.info(f"Release: {dirname}, NFO Link: {nfo_link}")
 
-        return predb_releases
+        return predb_releases, not predb_releases
 
     def get_pres(self) -> List[Pre]:
         logger.info("Getting pres from predbs")
 
-        # PreDBs in order of preference
-        predbs = [self.get_xrel_scene, self.get_xrel_p2p, self.get_predbde]
+        # PreDBs in reverse order of preference, later sources override
+        # duplicate dirnames of earlier ones
+        sources = {
+            "predb.net": self.get_predbde,
+            "xrel.to p2p": self.get_xrel_p2p,
+        }
+        for category in self.xrel_scene_categories:
+            sources[f"xrel.to {category}"] = partial(
+                self.get_xrel_scene_category, category)
         pres = dict()
 
-        for get_func in reversed(predbs):
+        # The sources don't depend on each other, so fetch them all at once
+        # and only merge them in order of preference afterwards
+        executor = ThreadPoolExecutor(max_workers=len(sources),
+                                      thread_name_prefix="predbs")
+        futures = {name: executor.submit(get_func)
+                   for name, get_func in sources.items()}
+        wait(futures.values(), timeout=self.timeout)
+        # Don't wait for sources that timed out, their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for name, future in futures.items():
+            if not future.done():
+                logger.warning(f"{name} timed out after {self.timeout} "
+                               "seconds, skipping..")
+                continue
             try:
-                releases = get_func()
-                # override duplicate dirnames in later iterations
+                releases, watermark = future.result()
                 pres.update((pre.dirname, pre) for pre in releases)
-            except (HTTPError, URLError) as e:
-                logger.error(e)
-                logger.warning("Connection to predb failed, skipping..")
-
-        if CONFIG.CONFIG["main"]["backup_nfos"].lower() == "yes":
-            logger.info("starting nfo download...")
-            for pre in pres.values():
-                self.download_nfo(pre.nfo_link, pre.dirname)
+                # Only sources whose releases made it in move their watermark,
+                # threads of timed out sources are left running
+                self.move_watermark(name, watermark)
+            except Exception as e:
+                logger.exception(e)
+                logger.warning(f"Connection to {name} failed, skipping..")
 
         return list(pres.values())
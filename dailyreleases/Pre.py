@@ -1,84 +1,45 @@
 """Class representing a PRE"""
 
-from datetime import datetime, timedelta
-import re
-
-STOPWORDS = (
-    "update",
-    "v[0-9]+",
-    "build[._-]?[0-9]+",
-    "iNTERNAL",
-    "incl",
-    "Standalone",
-    "Multilanguage",
-    "DLC",
-    "DLC[._-]?Unlocker",
-    "Steam[._-]?Edition",
-    "GOG",
-    "mac[._-]?os[._-]?x?",
-    "linux",
-)
-
-TAGS = (
-    "Hotfix",
-    "Crack[._-]?fix",
-    "Dir[._-]?fix",
-    "MULTI[._-]?[0-9]+",
-    "x(?:86|64)",
-    "(?:86|64)[._-]?bit",
-    "RIP",
-    "REPACK",
-    "German",
-    "Czech",
-    "Russian",
-    "Korean",
-    "Italian",
-    "Swedish",
-    "Danish",
-    "French",
-    "Slovak",
-)
-
-HIGHLIGHTS = (
-    "PROPER",
-    "READNFO",
-)
-
-BLACKLISTED = (
-    "Keygen",
-    "Keymaker",
-    "[._-]3DS",
-    "[._-]NSW",
-    "[._-]PS4",
-    "[._-]PSP",
-    "[._-]Wii",
-    "[._-]WiiU",
-    "x264",
-    "720p",
-    "1080p",
-    "eBook",
-    "TUTORIAL",
-    "Debian",
-    "Ubuntu",
-    "Fedora",
-    "openSUSE",
-    "jQuery",
-    "CSS" "ASP[._-]NET",
-    "Windows[._-]Server",
-    "Lynda",
-    "OREILLY" "Wintellectnow",
-    "3ds[._-]?Max",
-    "For[._-]Maya",
-    "Cinema4D",
-)
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Tuple
+
+from .parsing import ParsedRelease, ReleaseType, parse_dirname
+
+
+def day_bounds(day: date) -> Tuple[float, float]:
+    """
+    Return the timestamps at which the UTC `day` starts and ends. Computed
+    once per run instead of once per release.
+    """
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc).timestamp()
+    return start, start + timedelta(days=1).total_seconds()
 
 
 class Pre:
+    # Feeds return many releases that are thrown away again, so instances are
+    # kept small and parsing is deferred until the parsed fields are used
+    __slots__ = (
+        "dirname",
+        "nfo_link",
+        "group_name",
+        "timestamp",
+        "positive_reviews",
+        "total_reviews",
+        "steam_link",
+        "gog_link",
+        "epic_link",
+        "enriched",
+        "_parsed",
+    )
+
     def __init__(self, dirname: str, nfo_link: str, group_name: str,
                  timestamp: int):
         self.dirname = dirname
-        self.game_name = self.format_dirname()
         self.nfo_link = nfo_link
+        # The same few group names are repeated over and over
+        if isinstance(group_name, str):
+            group_name = sys.intern(group_name)
         self.group_name = group_name
         self.timestamp = timestamp
         self.positive_reviews: int = 0
@@ -86,17 +47,8 @@ class Pre:
         self.steam_link = None
         self.gog_link = None
         self.epic_link = None
-
-        if re.search("update|addon|Crack[._-]?fix|DIR[._-]?FIX|build[._-]?[0-9]+",
-                     dirname,
-                     flags=re.IGNORECASE,):
-            self.release_type = "update"
-        elif re.search(
-            "(?<!incl[._-])dlc", dirname, flags=re.IGNORECASE
-        ):  # 'Incl.DLC' isn't a DLC-release
-            self.release_type = "dlc"
-        else:
-            self.release_type = "game"
+        self.enriched = False
+        self._parsed = None
 
     @classmethod
     def from_row(cls, row):
@@ -106,41 +58,39 @@ class Pre:
             group_name=row["group_name"],
             timestamp=row["timestamp"]
         )
+        # Rows of pres which were enriched while polling carry the results
+        if "enriched_at" in row.keys() and row["enriched_at"] is not None:
+            pre.steam_link = row["steam_link"]
+            pre.gog_link = row["gog_link"]
+            pre.epic_link = row["epic_link"]
+            pre.positive_reviews = row["positive_reviews"]
+            pre.total_reviews = row["total_reviews"]
+            pre.enriched = True
         return pre
 
-    def format_dirname(self) -> str:
-        hyphen_index = self.dirname.find("-")
-        rls_name = self.dirname[:hyphen_index]
-        game_name, *stopwords = re.split(
-            r"[._-]({})".format("|".join(STOPWORDS + TAGS + HIGHLIGHTS)),
-            rls_name,
-            flags=re.IGNORECASE,
-            )
-
-        # Prettify game name by substituting word delimiters with spaces
-        game_name = re.sub("[_-]", " ", game_name)
-        # Only dots separated by at least two character on either side are substituted to allow titles like "R.O.V.E.R."
-        game_name = re.sub(r"[.](\w{2,})", r" \g<1>", game_name)
-        game_name = re.sub(r"(\w{2,})[.]", r"\g<1> ", game_name)
-
-        return game_name
-
-    def from_today(self) -> bool:
-        timestamp_datetime = datetime.utcfromtimestamp(self.timestamp)
-        today_date = datetime.now().date()
-        if timestamp_datetime.date() == today_date:
-            return True
-        else:
-            return False
+    @property
+    def parsed(self) -> ParsedRelease:
+        if self._parsed is None:
+            self._parsed = parse_dirname(self.dirname)
+        return self._parsed
+
+    @property
+    def game_name(self) -> str:
+        return self.parsed.game_name
+
+    @property
+    def release_type(self) -> ReleaseType:
+        return self.parsed.type
+
+    def from_today(self, today: Tuple[float, float] = None) -> bool:
+        start, end = today or day_bounds(datetime.now().date())
+        return start <= self.timestamp < end
+
+    def from_yesterday(self, yesterday: Tuple[float, float] = None) -> bool:
+        start, end = yesterday or day_bounds(
+            datetime.now().date() - timedelta(days=1))
+        return start <= self.timestamp < end
 
-    def from_yesterday(self) -> bool:
-        timestamp_datetime = datetime.utcfromtimestamp(self.timestamp)
-        yesterday_date = datetime.now().date() - timedelta(days=1)
-        if timestamp_datetime.date() == yesterday_date:
-            return True
-        else:
-            return False
-    
     def to_reddit_row(self):
         stores = []
         if self.steam_link is not None:
@@ -164,7 +114,7 @@ class Pre:
             else:
                 review_formatted = f"{ratio * 100:.2f}% ({self.positive_reviews})"
 
-        if self.release_type == "game":
+        if self.release_type == ReleaseType.GAME:
             row = f"| {self.game_name} | {self.group_name} | {stores_formatted} | {review_formatted} |"
         else:
             row = f"| {self.dirname} | {self.group_name} | {stores_formatted} | {review_formatted} |"
@@ -0,0 +1,195 @@
+"""Profiles a run and writes the reports into the data dir"""
+
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from .Config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """
+    Samples the stacks of all threads every `interval` seconds. Unlike
+    cProfile, functions run at full speed in between, so this is cheap
+    enough for production runs.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        # every sample has a stack of each thread
+        self.thread_samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.thread_samples += 1
+        self.samples += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="sampler")
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def format_folded(self) -> str:
+        """Stacks in the folded format of flamegraph.pl and speedscope"""
+        return "".join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+    def format_report(self, top: int) -> str:
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        # Threads that are waiting are sampled too, so percentages are of
+        # the time of all threads
+        thread_samples = max(self.thread_samples, 1)
+        lines = [f"{self.samples} samples every {self.interval}s, "
+                 f"{self.thread_samples} thread stacks", "",
+                 "Own samples:"]
+        lines.extend(f"{count:8d} {count / thread_samples:6.1%}  {function}"
+                     for function, count in own.most_common(top))
+        lines.extend(["", "Samples including callees:"])
+        lines.extend(f"{count:8d} {count / thread_samples:6.1%}  {function}"
+                     for function, count in total.most_common(top))
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    def __init__(self):
+        self.sampling = CONFIG.CONFIG.getboolean("profile", "sampling",
+                                                 fallback=False)
+        self.sample_interval = CONFIG.CONFIG.getfloat(
+            "profile", "sample_interval", fallback=0.01)
+        self.tracemalloc_frames = CONFIG.CONFIG.getint(
+            "profile", "tracemalloc_frames", fallback=10)
+        self.top = CONFIG.CONFIG.getint("profile", "top", fallback=50)
+        self.lock = threading.Lock()
+        self.thread_profiles = []
+
+    def profile_thread(self, *args):
+        # cProfile only sees the thread it is enabled in, every thread started
+        # during the run gets its own profile, which are added up in the end
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            logger.debug(f"Not profiling {threading.current_thread().name}: {e}")
+            return
+        with self.lock:
+            self.thread_profiles.append(profile)
+
+    def run(self, func: Callable, *args, **kwargs) -> Path:
+        """
+        Run `func` under the profiler and return the directory the reports
+        were written to.
+        """
+        report_dir = CONFIG.DATA_DIR.joinpath(
+            "profiles", datetime.now().strftime("%Y%m%d-%H%M%S"))
+        report_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.tracemalloc_frames > 0:
+            tracemalloc.start(self.tracemalloc_frames)
+        sampler = profile = None
+        if self.sampling:
+            sampler = StackSampler(self.sample_interval)
+            sampler.start()
+        else:
+            self.thread_profiles = []
+            threading.setprofile(self.profile_thread)
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            if sampler is not None:
+                sampler.stop()
+            else:
+                profile.disable()
+                threading.setprofile(None)
+            # Before writing the reports, which allocate plenty themselves
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                report_dir.joinpath("allocations.txt").write_text(
+                    self.format_allocations(snapshot, peak))
+
+            if sampler is not None:
+                report_dir.joinpath("samples.txt").write_text(
+                    sampler.format_report(self.top))
+                report_dir.joinpath("stacks.folded").write_text(
+                    sampler.format_folded())
+            else:
+                stats = pstats.Stats(profile)
+                with self.lock:
+                    for thread_profile in self.thread_profiles:
+                        stats.add(thread_profile)
+                stats.dump_stats(report_dir.joinpath("profile.pstats"))
+                report_dir.joinpath("report.txt").write_text(
+                    self.format_stats(stats))
+            logger.info(f"Profiled run took {duration:.1f}s, reports are in "
+                        f"{report_dir}")
+        return report_dir
+
+    def format_stats(self, stats: pstats.Stats) -> str:
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.strip_dirs()
+        for sort in ("cumulative", "tottime"):
+            stream.write(f"Sorted by {sort}:\n")
+            stats.sort_stats(sort).print_stats(self.top)
+        return stream.getvalue()
+
+    def format_allocations(self, snapshot: tracemalloc.Snapshot,
+                           peak: int) -> str:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        lines = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB", "",
+                 "Top allocation sites:"]
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  "
+                         f"{stat.traceback[0]}")
+        lines.extend(["", "Top allocation tracebacks:"])
+        for stat in snapshot.statistics("traceback")[:10]:
+            lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,181 @@
+"""Paces requests per host and backs off when a host throttles us"""
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from .Config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the number of seconds to wait from a Retry-After header"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimit:
+    """
+    Token bucket with adaptive concurrency for a single host. Successful
+    requests ramp the rate and concurrency back up towards their maximum,
+    throttled ones halve them.
+    """
+
+    def __init__(self, host: str, max_rate: float, burst: int,
+                 max_concurrency: int):
+        self.host = host
+        self.max_rate = max_rate
+        self.min_rate = min(0.2, max_rate)
+        self.max_concurrency = max_concurrency
+        self.rate = max_rate
+        self.concurrency = float(max_concurrency)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.throttles = 0
+        self.condition = threading.Condition()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if now < self.blocked_until:
+                    timeout = self.blocked_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    # woken up by release
+                    timeout = None
+                elif self.tokens < 1:
+                    timeout = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                self.condition.wait(timeout)
+
+    def release(self, throttled=False, retry_after: float = None):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                # Without Retry-After, back off exponentially
+                if retry_after is None:
+                    retry_after = min(2 ** (self.throttles - 1), 60)
+                self.blocked_until = max(self.blocked_until,
+                                         time.monotonic() + retry_after)
+                logger.warning(f"{self.host} is throttling, waiting "
+                               f"{retry_after:.1f}s and slowing down to "
+                               f"{self.rate:.1f} requests/s, "
+                               f"{int(self.concurrency)} concurrent")
+            else:
+                self.throttles = 0
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate / 20)
+                self.concurrency = min(self.max_concurrency,
+                                       self.concurrency + 1 / self.concurrency)
+            self.condition.notify_all()
+
+    def snapshot(self) -> dict:
+        with self.condition:
+            return {
+                "rate": round(self.rate, 2),
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "blocked_for": round(max(self.blocked_until - time.monotonic(), 0), 1),
+            }
+
+
+class RateLimiter:
+    def __init__(self):
+        web_config = CONFIG.CONFIG["web"]
+        self.max_rate = web_config.getfloat("host_rate_limit", fallback=10)
+        self.burst = web_config.getint("host_rate_burst", fallback=10)
+        self.max_concurrency = web_config.getint("host_concurrency",
+                                                 fallback=8)
+        self.retries = web_config.getint("throttle_retries", fallback=3)
+        self.hosts: Dict[str, HostLimit] = {}
+        self.lock = threading.Lock()
+
+    def get(self, host: str) -> HostLimit:
+        with self.lock:
+            limit = self.hosts.get(host)
+            if limit is None:
+                limit = HostLimit(host, self.max_rate, self.burst,
+                                  self.max_concurrency)
+                self.hosts[host] = limit
+            return limit
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return the current limits of every host requests were sent to"""
+        with self.lock:
+            hosts = dict(self.hosts)
+        return {host: limit.snapshot() for host, limit in sorted(hosts.items())}
+
+    def format_limits(self) -> str:
+        return ", ".join(f"{host}: {limits['rate']}/s x{limits['concurrency']}"
+                         for host, limits in self.snapshot().items())
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends every request of a session through the
+    limiter of its host, and retries throttled requests once the host allows.
+    """
+
+    def __init__(self, limiter: RateLimiter, timeout=None, **kwargs):
+        self.limiter = limiter
+        # Used for requests sent without a timeout, like those of libraries
+        # which don't set one
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        limit = self.limiter.get(urlsplit(request.url).netloc)
+        for attempt in range(self.limiter.retries + 1):
+            limit.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                # Timeouts and dropped connections mean the host is overloaded
+                limit.release(throttled=True, retry_after=0)
+                raise
+
+            throttled = response.status_code in THROTTLE_STATUSES
+            limit.release(throttled, parse_retry_after(
+                response.headers.get("Retry-After")))
+            if not throttled or attempt == self.limiter.retries:
+                return response
+            logger.debug(f"Retrying {request.url} after status "
+                         f"{response.status_code}")
+            response.close()
+
+
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,148 @@
+"""Fuzzy, case insensitive title matching backed by a trigram index"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import os
+import pickle
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Candidate sets up to this size are compared against every title, which
+# gives exactly the same results as difflib.get_close_matches.
+SCAN_LIMIT = 500
+# Number of titles sharing the most trigrams with the query that are scored
+CANDIDATES = 200
+INDEX_VERSION = 1
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleMatcher:
+    def __init__(self, titles: Iterable[str] = ()):
+        # Like case_insensitive_close_matches always did, the last title wins
+        # if several only differ in case
+        titles = {title.lower(): title for title in titles}
+        self.lowered: List[str] = list(titles)
+        self.titles: List[str] = list(titles.values())
+        self.index = defaultdict(lambda: array("I"))
+        if len(self.lowered) > SCAN_LIMIT:
+            for i, title in enumerate(self.lowered):
+                for gram in trigrams(title):
+                    self.index[gram].append(i)
+
+    def __len__(self):
+        return len(self.lowered)
+
+    def save(self, path: Path):
+        tmp_path = Path(f"{path}.tmp")
+        with tmp_path.open("wb") as file:
+            pickle.dump((INDEX_VERSION, self.lowered, self.titles,
+                         dict(self.index)), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[TitleMatcher]:
+        """Load a saved matcher, or return None if there's no usable one"""
+        try:
+            with Path(path).open("rb") as file:
+                version, lowered, titles, index = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError) as e:
+            logger.debug("Could not load title index %s: %s", path, e)
+            return None
+        if version != INDEX_VERSION:
+            return None
+
+        matcher = cls()
+        matcher.lowered = lowered
+        matcher.titles = titles
+        matcher.index.update(index)
+        return matcher
+
+    def candidates(self, word: str, cutoff: float) -> Iterable[int]:
+        if len(self.lowered) <= SCAN_LIMIT:
+            return range(len(self.lowered))
+
+        # ratio() can never exceed real_quick_ratio(), which only depends on
+        # the lengths, so titles with too different lengths are skipped
+        min_length = len(word) * cutoff / (2 - cutoff) if cutoff else 0
+        max_length = len(word) * (2 - cutoff) / cutoff if cutoff else float("inf")
+
+        counts = Counter()
+        for gram in trigrams(word):
+            postings = self.index.get(gram)
+            if postings is not None:
+                counts.update(postings)
+        candidates = (i for i in counts
+                      if min_length <= len(self.lowered[i]) <= max_length)
+        return heapq.nlargest(CANDIDATES, candidates, key=counts.__getitem__)
+
+    def get_close_matches(self, word: str, n=3, cutoff=0.6) -> List[str]:
+        """
+        Return the `n` titles closest to `word` with a similarity of at least
+        `cutoff`, scored the same way as difflib.get_close_matches.
+        """
+        if not n > 0:
+            raise ValueError("n must be > 0: %r" % (n,))
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+
+        word = word.lower()
+        result = []
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        for i in self.candidates(word, cutoff):
+            s.set_seq1(self.lowered[i])
+            if s.real_quick_ratio() >= cutoff and \
+               s.quick_ratio() >= cutoff and \
+               s.ratio() >= cutoff:
+                result.append((s.ratio(), self.lowered[i], i))
+
+        return [self.titles[i] for _, _, i in heapq.nlargest(n, result)]
+
+    def get_close_matches_many(self, words: Sequence[str], n=3, cutoff=0.6,
+                               workers: int = None) -> List[List[str]]:
+        """
+        Match all `words`, spread over `workers` processes. Every worker gets
+        a copy of the index once instead of once per word.
+        """
+        if workers == 1 or len(words) < 2:
+            return [self.get_close_matches(word, n, cutoff) for word in words]
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self,)) as executor:
+            chunksize = max(1, len(words) // ((workers or os.cpu_count()) * 4))
+            return list(executor.map(_match_in_worker, words,
+                                     [n] * len(words), [cutoff] * len(words),
+                                     chunksize=chunksize))
+
+    def __getstate__(self):
+        return self.lowered, self.titles, dict(self.index)
+
+    def __setstate__(self, state):
+        self.lowered, self.titles, index = state
+        self.index = defaultdict(lambda: array("I"), index)
+
+
+_worker_matcher: Optional[TitleMatcher] = None
+
+
+def _init_worker(matcher: TitleMatcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def _match_in_worker(word: str, n: int, cutoff: float) -> List[str]:
+    return _worker_matcher.get_close_matches(word, n, cutoff)
@@ -1,69 +1,123 @@
 import logging
 from datetime import time, datetime, timedelta
 from time import sleep
-from discord_webhook import DiscordWebhook
 
-from .stores.StoreHandler import StoreHandler
 from . import __version__
 from .Config import CONFIG
+from .DiscordLogHandler import DiscordLogHandler
 from .Generator import Generator
+from .Metrics import METRICS
+from .Profiler import Profiler
 
 logger = logging.getLogger(__name__)
 
 
-class DiscordLogHandler(logging.Handler):
-    def emit(self, record):
-        log_msg = self.format(record)
-        webhook = DiscordWebhook(url=CONFIG.CONFIG["discord"]
-                                 ["debug_webhook_url"],
-                                 content=log_msg)
-        webhook.execute()
-
-
 class Main:
     def __init__(self):
         self.generator = Generator()
         
     def run_midnight_mode(self):
-        storehandler = StoreHandler()
+        self.resume_unfinished_run()
+        warm_up_seconds = CONFIG.CONFIG.getint("web", "warm_up_seconds",
+                                               fallback=30)
         while True:
             try:
                 now = datetime.now()
                 midnight = datetime.combine(now + timedelta(days=1), time.min)
                 until_midnight = midnight - now
                 logger.info(f"Waiting {until_midnight} until midnight..")
-                sleep(until_midnight.total_seconds())
-                storehandler.epic.load_offerid_json()
-                self.generator.generate(
-                    discord_post=True,
-                    pm_recipients=CONFIG.CONFIG["reddit"]
-                    ["notify_users"].split(",")
-                )
+                warm_up_time = midnight - timedelta(seconds=warm_up_seconds)
+                if warm_up_seconds > 0 and warm_up_time > now:
+                    sleep((warm_up_time - now).total_seconds())
+                    self.generator.warm_up()
+                    now = datetime.now()
+                sleep(max((midnight - now).total_seconds(), 0))
+                self.generator.store_handler.epic.refresh_offerids()
+                self.generator.generate(discord_post=True)
+            except Exception as e:
+                logger.exception(e)
+            except KeyboardInterrupt:
+                print("Exiting (KeyboardInterrupt)")
+                break
+
+    def resume_unfinished_run(self):
+        # Messages that weren't delivered before the last exit go out first
+        self.generator.outbox.start()
+        # A run interrupted by a crash is finished right away instead of at
+        # the next midnight
+        if self.generator.has_unfinished_run(discord_post=True):
+            logger.info("Resuming unfinished run")
+            try:
+                self.generator.generate(discord_post=True)
+            except Exception as e:
+                logger.exception(e)
+
+    def run_polling_mode(self):
+        self.resume_unfinished_run()
+        while True:
+            try:
+                now = datetime.now()
+                midnight = datetime.combine(now + timedelta(days=1), time.min)
+                self.generator.poll()
+
+                now = datetime.now()
+                interval = timedelta(
+                    seconds=self.generator.poll_interval(now))
+                if now + interval < midnight:
+                    logger.info(f"Polling again in {interval}..")
+                    sleep(interval.total_seconds())
+                    continue
+
+                logger.info(f"Waiting {midnight - now} until midnight..")
+                sleep(max((midnight - now).total_seconds(), 0))
+                self.generator.store_handler.epic.refresh_offerids()
+                # Everything but the last few releases is enriched already
+                self.generator.generate(discord_post=True)
             except Exception as e:
                 logger.exception(e)
+                sleep(60)
             except KeyboardInterrupt:
                 print("Exiting (KeyboardInterrupt)")
                 break
 
     def run_immediate_mode(self):
-        self.generator.generate(
-            discord_post=True,
-            pm_recipients=CONFIG.CONFIG["reddit"]["notify_users"].split(",")
-            )
+        self.generator.generate(discord_post=True)
+        # The process exits right after, give the outbox a chance to deliver
+        self.generator.outbox.drain(CONFIG.CONFIG.getfloat(
+            "outbox", "drain_timeout", fallback=300))
 
     def run_test_mode(self):
         self.generator.generate(discord_post=False)
 
+    def run_profile_mode(self):
+        discord_post = CONFIG.CONFIG.getboolean("profile", "discord_post",
+                                                fallback=False)
+        Profiler().run(self.generator.generate, discord_post=discord_post)
+        if discord_post:
+            self.generator.outbox.drain(CONFIG.CONFIG.getfloat(
+                "outbox", "drain_timeout", fallback=300))
+
     def run_main(self):
         try:
             print(f"Starting Daily Releases Bot v{__version__}")
             mode = CONFIG.CONFIG["main"]["mode"]
             if CONFIG.CONFIG['discord']['enable_debughook'] == 'yes':
                 logger.info("Enabling discord webhook debug log.")
-                logging.getLogger().addHandler(DiscordLogHandler())
+                discord_config = CONFIG.CONFIG["discord"]
+                CONFIG.add_log_handler(DiscordLogHandler(
+                    discord_config["debug_webhook_url"],
+                    interval=discord_config.getfloat("debughook_interval",
+                                                     fallback=2),
+                    capacity=discord_config.getint("debughook_buffer",
+                                                   fallback=1000)))
             else:
                 logger.info("Set enable_debughook to 'yes' if discord debug "
                             "log is needed.")
+            metrics_port = CONFIG.CONFIG.getint("metrics", "port", fallback=0)
+            if metrics_port:
+                METRICS.serve(CONFIG.CONFIG.get("metrics", "host",
+                                                fallback="127.0.0.1"),
+                              metrics_port)
             logger.info(f"Running in mode: {mode}")
             if mode == "test":
                 self.run_test_mode()
@@ -71,6 +125,10 @@ class Main:
                 self.run_immediate_mode()
             if mode == "midnight":
                 self.run_midnight_mode()
+            if mode == "polling":
+                self.run_polling_mode()
+            if mode == "profile":
+                self.run_profile_mode()
         except Exception as e:
             logger.exception(e)
             raise e
@@ -0,0 +1,217 @@
+"""Parsing of release dirnames into game name, type, platform and tags"""
+
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+from enum import Enum, Flag, auto
+from functools import lru_cache
+from typing import Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .Pre import Pre
+
+
+class ReleaseType(str, Enum):
+    GAME = "game"
+    UPDATE = "update"
+    DLC = "dlc"
+
+
+class Platform(str, Enum):
+    WINDOWS = "Windows"
+    OSX = "Mac OSX"
+    LINUX = "Linux"
+
+
+class ParseError(Exception):
+    pass
+
+
+class Kind(Flag):
+    STOP = auto()  # ends the game name
+    TAG = auto()
+    HIGHLIGHT = auto()
+    UPDATE = auto()
+    DLC = auto()
+    OSX = auto()
+    LINUX = auto()
+
+
+# Every word the classifier knows with what it means. Where words overlap at
+# the same position, the first one in the table wins.
+TOKENS = (
+    ("update", Kind.STOP | Kind.UPDATE),
+    ("addon", Kind.UPDATE),
+    ("v[0-9]+", Kind.STOP),
+    ("build[._-]?[0-9]+", Kind.STOP | Kind.UPDATE),
+    ("iNTERNAL", Kind.STOP),
+    ("incl", Kind.STOP),
+    ("Standalone", Kind.STOP),
+    ("Multilanguage", Kind.STOP),
+    # 'Incl.DLC' isn't a DLC-release
+    ("(?<!incl[._-])DLC[._-]?Unlocker", Kind.STOP | Kind.DLC),
+    ("(?<!incl[._-])DLC", Kind.STOP | Kind.DLC),
+    ("Steam[._-]?Edition", Kind.STOP),
+    ("GOG", Kind.STOP),
+    ("mac[._-]?os[._-]?x?", Kind.STOP | Kind.OSX),
+    ("linux", Kind.STOP | Kind.LINUX),
+    ("Hotfix", Kind.STOP | Kind.TAG),
+    ("Crack[._-]?fix", Kind.STOP | Kind.TAG | Kind.UPDATE),
+    ("Dir[._-]?fix", Kind.STOP | Kind.TAG | Kind.UPDATE),
+    ("MULTI[._-]?[0-9]+", Kind.STOP | Kind.TAG),
+    ("x(?:86|64)", Kind.STOP | Kind.TAG),
+    ("(?:86|64)[._-]?bit", Kind.STOP | Kind.TAG),
+    ("RIP", Kind.STOP | Kind.TAG),
+    ("REPACK", Kind.STOP | Kind.TAG),
+    ("German", Kind.STOP | Kind.TAG),
+    ("Czech", Kind.STOP | Kind.TAG),
+    ("Russian", Kind.STOP | Kind.TAG),
+    ("Korean", Kind.STOP | Kind.TAG),
+    ("Italian", Kind.STOP | Kind.TAG),
+    ("Swedish", Kind.STOP | Kind.TAG),
+    ("Danish", Kind.STOP | Kind.TAG),
+    ("French", Kind.STOP | Kind.TAG),
+    ("Slovak", Kind.STOP | Kind.TAG),
+    ("PROPER", Kind.STOP | Kind.HIGHLIGHT),
+    ("READNFO", Kind.STOP | Kind.HIGHLIGHT),
+)
+
+BLACKLISTED = (
+    "Keygen",
+    "Keymaker",
+    "[._-]3DS",
+    "[._-]NSW",
+    "[._-]PS4",
+    "[._-]PSP",
+    "[._-]Wii",
+    "[._-]WiiU",
+    "x264",
+    "720p",
+    "1080p",
+    "eBook",
+    "TUTORIAL",
+    "Debian",
+    "Ubuntu",
+    "Fedora",
+    "openSUSE",
+    "jQuery",
+    "CSS" "ASP[._-]NET",
+    "Windows[._-]Server",
+    "Lynda",
+    "OREILLY" "Wintellectnow",
+    "3ds[._-]?Max",
+    "For[._-]Maya",
+    "Cinema4D",
+)
+
+DELIMITERS = "._-"
+
+# All tokens are wrapped in a single lookahead, so the scan visits every
+# position of the dirname exactly once without one token consuming another.
+CLASSIFIER = re.compile(
+    "(?=(?P<blacklisted>{})|{})".format(
+        "|".join(BLACKLISTED),
+        "|".join(f"(?P<t{i}>{pattern})" for i, (pattern, _) in enumerate(TOKENS)),
+    ),
+    flags=re.IGNORECASE,
+)
+KINDS = {f"t{i}": kind for i, (_, kind) in enumerate(TOKENS)}
+
+
+@dataclass(frozen=True)
+class ParsedRelease:
+    dirname: str
+    rls_name: str
+    group: str
+    game_name: str
+    type: ReleaseType
+    platform: Platform
+    tags: Tuple[str, ...]
+    highlights: Tuple[str, ...]
+    blacklisted: Optional[str]
+
+
+def prettify(game_name: str) -> str:
+    # Prettify game name by substituting word delimiters with spaces
+    game_name = re.sub("[_-]", " ", game_name)
+    # Only dots separated by at least two character on either side are substituted to allow titles like "R.O.V.E.R."
+    game_name = re.sub(r"[.](\w{2,})", r" \g<1>", game_name)
+    game_name = re.sub(r"(\w{2,})[.]", r"\g<1> ", game_name)
+    return game_name
+
+
+@lru_cache(maxsize=4096)
+def parse_dirname(dirname: str) -> ParsedRelease:
+    """
+    Classify `dirname` in a single scan. Results are memoized, since the same
+    dirnames are returned by several PREdbs and over several runs.
+    """
+    rls_name, _, group = dirname.rpartition("-")
+    if not rls_name:
+        rls_name, group = dirname, ""
+
+    name_end = None
+    release_type = ReleaseType.GAME
+    platform = Platform.WINDOWS
+    tags = []
+    highlights = []
+    blacklisted = None
+
+    for match in CLASSIFIER.finditer(dirname):
+        token = match.group(match.lastgroup)
+        if match.lastgroup == "blacklisted":
+            blacklisted = blacklisted or token
+            continue
+
+        kind = KINDS[match.lastgroup]
+        start = match.start()
+        # Type words count anywhere, e.g. 'Updated' makes an update
+        if kind & Kind.UPDATE:
+            release_type = ReleaseType.UPDATE
+        elif kind & Kind.DLC and release_type is ReleaseType.GAME:
+            release_type = ReleaseType.DLC
+
+        # All other words only count as separate words of the release name
+        if start == 0 or start >= len(rls_name) or dirname[start - 1] not in DELIMITERS:
+            continue
+        # Optional trailing delimiters may have run into the group name
+        token = token[:len(rls_name) - start]
+        end = start + len(token)
+        if kind & Kind.STOP and name_end is None:
+            name_end = start - 1
+        if kind & Kind.OSX and platform is Platform.WINDOWS:
+            platform = Platform.OSX
+        if kind & Kind.LINUX and platform is Platform.WINDOWS:
+            platform = Platform.LINUX
+        if end < len(rls_name) and dirname[end] not in DELIMITERS:
+            continue
+        if kind & Kind.TAG:
+            tags.append(token)
+        if kind & Kind.HIGHLIGHT:
+            highlights.append(token)
+
+    return ParsedRelease(
+        dirname=dirname,
+        rls_name=rls_name,
+        group=group,
+        game_name=prettify(rls_name[:name_end]),
+        type=release_type,
+        platform=platform,
+        tags=tuple(tags),
+        highlights=tuple(highlights),
+        blacklisted=blacklisted,
+    )
+
+
+def parse_pre(pre: Pre, max_age_hours=48) -> ParsedRelease:
+    """
+    Parse the dirname of `pre`, raising ParseError if it shouldn't be posted.
+    """
+    parsed = parse_dirname(pre.dirname)
+    if parsed.blacklisted is not None:
+        raise ParseError(f"Contains blacklisted word: {parsed.blacklisted}")
+    if time.time() - pre.timestamp > max_age_hours * 3600:
+        raise ParseError(f"Older than {max_age_hours} hours")
+    return parsed
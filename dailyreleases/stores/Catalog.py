@@ -0,0 +1,276 @@
+"""Local mirror of the store catalogs to look up games without searching"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .. import util
+from ..APIHelper import APIHelper
+from ..Config import CONFIG
+from ..TitleMatcher import TitleMatcher
+from .Epic import Epic, api
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog(APIHelper):
+    def __init__(self, epic: Epic, path=None):
+        self.epic = epic
+        self.steam_applist_api = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+        self.steam_storeservice_api = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+        self.gog_catalog_api = "https://catalog.gog.com/v1/catalog"
+        self.steam_api_key = CONFIG.CONFIG.get("catalog", "steam_api_key",
+                                               fallback="")
+        self.refresh_interval = CONFIG.CONFIG.getint(
+            "catalog", "refresh_hours", fallback=24) * 3600
+        self.urls = {
+            "steam": "https://store.steampowered.com/{type}/{id}",
+            "gog": "https://www.gog.com/en/game/{slug}",
+            "epic": "https://store.epicgames.com/en-US/p/{slug}",
+        }
+        self.fetchers = {
+            "steam": self.fetch_steam,
+            "gog": self.fetch_gog,
+            "epic": self.fetch_epic,
+        }
+
+        path = path or CONFIG.DATA_DIR.joinpath("catalog.sqlite")
+        # The title index of every store is kept next to the mirror
+        self.index_dir = Path(path).parent if path != ":memory:" else None
+        self.matchers: Dict[str, TitleMatcher] = {}
+
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        self.lock = threading.RLock()
+        self.setup()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS
+                products (store TEXT,
+                          id TEXT,
+                          title TEXT,
+                          norm_title TEXT,
+                          type TEXT,
+                          slug TEXT,
+                          PRIMARY KEY (store, id));
+                CREATE INDEX IF NOT EXISTS products_norm_title
+                ON products (store, norm_title);
+
+                -- timestamp of the last successful refresh of every store
+                CREATE TABLE IF NOT EXISTS
+                refreshes (store TEXT PRIMARY KEY,
+                           timestamp INTEGER);
+                """
+            )
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        return " ".join(title.lower().split())
+
+    def last_refresh(self, store: str) -> Optional[int]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT timestamp FROM refreshes WHERE store = :store;",
+                {"store": store},
+            ).fetchone()
+        return row["timestamp"] if row is not None else None
+
+    def has(self, store: str) -> bool:
+        return self.last_refresh(store) is not None
+
+    def refresh(self, only_missing=False):
+        """
+        Refresh the mirror of every store that is older than refresh_hours,
+        or, if `only_missing`, only of stores that were never mirrored.
+        """
+        for store, fetch in self.fetchers.items():
+            last_refresh = self.last_refresh(store)
+            if last_refresh is not None and (
+                    only_missing
+                    or time.time() - last_refresh < self.refresh_interval):
+                continue
+            try:
+                self.refresh_store(store, fetch, last_refresh)
+            except Exception as e:
+                logger.exception(e)
+                logger.warning(f"Failed to refresh {store} catalog, keeping "
+                               "the old one.")
+
+    def refresh_store(self, store: str, fetch, last_refresh: Optional[int]):
+        logger.info(f"Refreshing {store} catalog")
+        started = int(time.time())
+        incremental, products = fetch(last_refresh)
+
+        rows = [
+            {
+                "store": store,
+                "id": str(product_id),
+                "title": title,
+                "norm_title": self.normalize_title(title),
+                "type": product_type,
+                "slug": slug,
+            }
+            for product_id, title, product_type, slug in products
+        ]
+        # Everything is fetched before touching the mirror, so a failed
+        # refresh leaves the old mirror intact
+        with self.lock, self.connection:
+            if not incremental:
+                self.connection.execute(
+                    "DELETE FROM products WHERE store = :store;",
+                    {"store": store})
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO products(store, id, title, norm_title, type, slug)
+                VALUES (:store, :id, :title, :norm_title, :type, :slug);
+                """,
+                rows,
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO refreshes(store, timestamp) VALUES (:store, :timestamp);",
+                {"store": store, "timestamp": started},
+            )
+        logger.info(f"Stored {len(rows)} products in {store} catalog "
+                    f"({'incremental' if incremental else 'full'} refresh)")
+        with self.lock:
+            self.matchers.pop(store, None)
+            if self.index_dir is not None:
+                self.index_path(store).unlink(missing_ok=True)
+
+    def index_path(self, store: str) -> Path:
+        return self.index_dir.joinpath(f"catalog-{store}.index")
+
+    def matcher(self, store: str) -> TitleMatcher:
+        """
+        Return the title index of the mirror of `store`. It is built once after
+        every refresh and saved, so later runs only have to load it.
+        """
+        with self.lock:
+            matcher = self.matchers.get(store)
+            if matcher is not None:
+                return matcher
+
+            if self.index_dir is not None:
+                path = self.index_path(store)
+                # An index older than the mirror is from before a refresh
+                if path.exists() and path.stat().st_mtime >= (self.last_refresh(store) or 0):
+                    matcher = TitleMatcher.load(path)
+            if matcher is None:
+                titles = self.connection.execute(
+                    "SELECT title FROM products WHERE store = :store;",
+                    {"store": store},
+                ).fetchall()
+                matcher = TitleMatcher(row["title"] for row in titles)
+                logger.debug("Built title index of %s catalog with %s titles",
+                             store, len(matcher))
+                if self.index_dir is not None:
+                    matcher.save(self.index_path(store))
+
+            self.matchers[store] = matcher
+            return matcher
+
+    def fetch_steam(self, last_refresh: Optional[int]) -> Tuple[bool, list]:
+        if not self.steam_api_key:
+            # Without an API key, only the full app list can be fetched
+            r = self.send_request(self.steam_applist_api)
+            apps = r.json()["applist"]["apps"]
+            return False, [(app["appid"], app["name"], "app", "")
+                           for app in apps if app["name"]]
+
+        # Only apps that changed since the last refresh are returned
+        parameters = {
+            "key": self.steam_api_key,
+            "include_games": 1,
+            "include_dlc": 1,
+            "max_results": 50000,
+            "if_modified_since": last_refresh or 0,
+        }
+        products = []
+        while True:
+            r = self.send_request(self.steam_storeservice_api, parameters)
+            response = r.json()["response"]
+            products.extend((app["appid"], app["name"], "app", "")
+                            for app in response.get("apps", []))
+            if not response.get("have_more_results"):
+                return last_refresh is not None, products
+            parameters["last_appid"] = response["last_appid"]
+
+    def fetch_gog(self, last_refresh: Optional[int]) -> Tuple[bool, list]:
+        products = []
+        page = 1
+        while True:
+            parameters = {
+                "limit": 48,
+                "page": page,
+                "order": "asc:title",
+                # the GOG search only looks for games as well
+                "productType": "in:game,pack",
+            }
+            r = self.send_request(self.gog_catalog_api, parameters)
+            response = r.json()
+            for product in response["products"]:
+                products.append((product["id"], product["title"],
+                                 product["productType"], product["slug"]))
+            if page >= response["pages"]:
+                return False, products
+            page += 1
+
+    def fetch_epic(self, last_refresh: Optional[int]) -> Tuple[bool, list]:
+        products = []
+        start = 0
+        while True:
+            data = api.fetch_store_games(count=100, start=start,
+                                         with_price=False)
+            search_store = data["data"]["Catalog"]["searchStore"]
+            for element in search_store["elements"]:
+                slug = self.epic.offerids.get(element["id"])
+                if slug is not None:
+                    products.append((element["id"], element["title"],
+                                     element.get("offerType", ""), slug))
+            start += len(search_store["elements"])
+            if not search_store["elements"] or start >= search_store["paging"]["total"]:
+                return False, products
+
+    def find(self, store: str, norm_title: str) -> list:
+        with self.lock:
+            return self.connection.execute(
+                """
+                SELECT id, title, type, slug
+                FROM products
+                WHERE store = :store AND norm_title = :norm_title;
+                """,
+                {"store": store, "norm_title": norm_title},
+            ).fetchall()
+
+    def resolve(self, store: str, game_name: str) -> Optional[str]:
+        """
+        Look up `game_name` in the mirror of `store` with the same cutoff as
+        the live store searches. Returns the store url of the best match.
+        """
+        rows = self.find(store, self.normalize_title(game_name))
+        if not rows:
+            matches = self.matcher(store).get_close_matches(game_name, n=1,
+                                                            cutoff=0.90)
+            if matches:
+                rows = self.find(store, self.normalize_title(matches[0]))
+
+        products = {row["title"]: row for row in rows}
+        matches = util.case_insensitive_close_matches(game_name, products,
+                                                      n=1, cutoff=0.90)
+        if not matches:
+            logger.debug("Unable to find %s in %s catalog", game_name, store)
+            return None
+
+        best_match = products[matches[0]]
+        logger.debug("Best match in %s catalog is '%s'", store,
+                     best_match["title"])
+        return self.urls[store].format(**best_match)
@@ -1,28 +1,35 @@
 from __future__ import annotations
-import requests
 import logging
-from typing import Optional
+from typing import List, Optional
 from epicstore_api import EpicGamesStoreAPI
-from json import loads
 
 from ..util import case_insensitive_close_matches, retry
-from ..Config import CONFIG
+from ..APIHelper import APIHelper
+from .OfferIds import OfferIds
 
 logger = logging.getLogger(__name__)
 api = EpicGamesStoreAPI()
+# epicstore_api uses its own session, which is paced like all others
+APIHelper.mount_adapter(api._session)
 
 
-class Epic():
-    def __init__(self):
+class Epic(APIHelper):
+    def __init__(self, offerids: OfferIds = None):
         self.epic_api_url = "https://store.epicgames.com/en-US/p/"
-        self.offerid_json = {}
+        self.graphql_api = "https://graphql.epicgames.com/graphql"
+        self.offerids = offerids or OfferIds()
 
-    @retry()
-    def load_offerid_json(self):
-        egs_offerid_url = CONFIG.CONFIG['main']['egs_offeridapi_url']
-        logger.debug("Loading EGS offerid defintions from " + egs_offerid_url)
-        offerid_txt = requests.get(egs_offerid_url).content.decode()
-        self.offerid_json = loads(offerid_txt)
+    def warm_up(self, urls: List[str], session=None):
+        # Searches go through the session of epicstore_api
+        super().warm_up(urls, session or api._session)
+
+    def refresh_offerids(self):
+        try:
+            self.offerids.refresh()
+        except Exception as e:
+            logger.exception(e)
+            logger.warning("Failed to refresh EGS offerid definitions, "
+                           "keeping the old ones.")
 
     @retry()
     def get_epic_games_data(self, query: str):
@@ -30,22 +37,32 @@ class Epic():
         return search_json
 
     def search(self, game_name: str) -> Optional[str]:
+        """
+        Return the store url of `game_name`, or None if it isn't on the store.
+        Raises if the search failed, so the failure isn't taken as a miss.
+        """
+        logger.debug("Searching Epic Games Store for %s", game_name)
         try:
-            logger.debug("Searching Epic Games Store for %s", game_name)
             data = self.get_epic_games_data(game_name)
-            if "data" in data and "Catalog" in data["data"]:
-                elements = data["data"]["Catalog"]["searchStore"]["elements"]
-                matches = case_insensitive_close_matches(
-                    game_name, [element["title"] for element in elements]
-                )
-                for match in matches:
-                    for element in elements:
-                        if element["title"].lower() == match.lower():
-                            if self.offerid_json == {}:
-                                self.load_offerid_json()
-                            url = "https://store.epicgames.com/en-US/p/" + self.offerid_json[element['id']]
-                            logger.debug("Best match is '%s' '%s'", element["title"], url)
-                            return url
-        except Exception as e:
-            print("Error searching in Epic Games Store:", e)
+        except Exception:
+            logger.exception("Error searching in Epic Games Store for %s", game_name)
+            raise
+        if "data" not in data or "Catalog" not in data["data"]:
+            raise ConnectionError(f"Epic Games Store search for {game_name} "
+                                  f"failed: {data.get('errors')}")
+
+        elements = data["data"]["Catalog"]["searchStore"]["elements"]
+        matches = case_insensitive_close_matches(
+            game_name, [element["title"] for element in elements]
+        )
+        for match in matches:
+            for element in elements:
+                if element["title"].lower() == match.lower():
+                    slug = self.offerids.get(element['id'])
+                    if slug is None:
+                        logger.debug("No EGS offerid definition for '%s'", element["title"])
+                        continue
+                    url = "https://store.epicgames.com/en-US/p/" + slug
+                    logger.debug("Best match is '%s' '%s'", element["title"], url)
+                    return url
         return None
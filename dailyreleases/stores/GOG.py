@@ -14,6 +14,9 @@ class GOG(APIHelper):
     def search(self, query: str):
         parameters = {"search": query, "mediaType": "game", "limit": 5}
         r = self.send_request(self.games_api, parameters)
+        if r is None:
+            # Not a miss, so it isn't cached as one
+            raise ConnectionError(f"GOG search for {query} failed")
         products = {p["title"]: p for p in r.json()["products"] if p["isGame"]}
 
         try:
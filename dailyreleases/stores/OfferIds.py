@@ -0,0 +1,132 @@
+"""Disk-backed map of Epic offer ids to store slugs"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from ..APIHelper import APIHelper
+from ..Config import CONFIG
+from ..util import retry
+
+logger = logging.getLogger(__name__)
+
+
+class OfferIds(APIHelper):
+    def __init__(self, path=None):
+        self.url = CONFIG.CONFIG["main"]["egs_offeridapi_url"]
+        # Seconds after which the map is revalidated when it is used
+        self.max_age = CONFIG.CONFIG.getfloat(
+            "main", "egs_offerid_max_age", fallback=12) * 3600
+        self.revalidation_failed = False
+        connection = sqlite3.connect(
+            path or CONFIG.DATA_DIR.joinpath("offerids.sqlite"),
+            check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self.connection = connection
+        # searches run concurrently, only one of them should load the map
+        self.lock = threading.RLock()
+        self.setup()
+
+    def setup(self):
+        with self.lock:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS
+                offerids (id TEXT PRIMARY KEY,
+                          slug TEXT) WITHOUT ROWID;
+
+                -- validators of the last downloaded map for revalidation
+                CREATE TABLE IF NOT EXISTS
+                meta (key TEXT PRIMARY KEY,
+                      value TEXT);
+                """
+            )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = :key;", {"key": key}
+        ).fetchone()
+        return row["value"] if row is not None else None
+
+    def is_loaded(self) -> bool:
+        with self.lock:
+            return self.get_meta("url") == self.url
+
+    def is_stale(self) -> bool:
+        with self.lock:
+            fetched_at = self.get_meta("fetched_at")
+        return fetched_at is None or time.time() - float(fetched_at) > self.max_age
+
+    def set_fetched_at(self):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES ('fetched_at', :value);",
+            {"value": str(time.time())},
+        )
+
+    @retry()
+    def refresh(self) -> bool:
+        """
+        Revalidate the stored map, only downloading it again if it changed.
+        Returns True if the map was updated.
+        """
+        with self.lock:
+            headers = {}
+            if self.is_loaded():
+                etag = self.get_meta("etag")
+                last_modified = self.get_meta("last_modified")
+                if etag is not None:
+                    headers["If-None-Match"] = etag
+                if last_modified is not None:
+                    headers["If-Modified-Since"] = last_modified
+
+            logger.debug("Loading EGS offerid definitions from %s", self.url)
+            r = self.send_request(self.url, headers=headers)
+            if r is None:
+                raise ConnectionError("Failed to load EGS offerid definitions")
+            if r.status_code == 304:
+                logger.debug("EGS offerid definitions are unchanged")
+                with self.connection:
+                    self.set_fetched_at()
+                return False
+
+            offerids = r.json()
+            with self.connection:
+                self.connection.execute("DELETE FROM offerids;")
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO offerids(id, slug) VALUES (?, ?);",
+                    offerids.items(),
+                )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?);",
+                    [("url", self.url),
+                     ("etag", r.headers.get("ETag")),
+                     ("last_modified", r.headers.get("Last-Modified"))],
+                )
+                self.set_fetched_at()
+            self.revalidation_failed = False
+            logger.info("Stored %s EGS offerid definitions", len(offerids))
+            return True
+
+    def get(self, offer_id: str) -> Optional[str]:
+        """
+        Return the store slug of `offer_id`. The map is only downloaded if
+        there is none on disk yet, and revalidated once it is older than
+        egs_offerid_max_age hours.
+        """
+        with self.lock:
+            if not self.is_loaded():
+                self.refresh()
+            elif self.is_stale() and not self.revalidation_failed:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"Failed to revalidate EGS offerid "
+                                   f"definitions, using the old ones: {e}")
+                    # Not tried again by every lookup of this run
+                    self.revalidation_failed = True
+            row = self.connection.execute(
+                "SELECT slug FROM offerids WHERE id = :id;", {"id": offer_id}
+            ).fetchone()
+        return row["slug"] if row is not None else None
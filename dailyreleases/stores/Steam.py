@@ -84,6 +84,9 @@ class Steam(APIHelper):
             f"{self.search_api}",
             {"term": query, "f": "json", "cc": "US", "l": "english"}
             )
+        if r is None:
+            # Not a miss, so it isn't cached as one
+            raise ConnectionError(f"Steam search for {query} failed")
 
     # Reverse results to make the first one take precedence over later ones if multiple results have the same name.
     # E.g. "Wolfenstein II: The New Colossus" has both international and german version under the same name.
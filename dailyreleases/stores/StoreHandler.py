@@ -1,7 +1,9 @@
 from ..APIHelper import APIHelper
+from ..Config import CONFIG
 from .Steam import Steam
 from .GOG import GOG
 from .Epic import Epic
+from .Catalog import Catalog
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,3 +14,6 @@ class StoreHandler(APIHelper):
         self.steam = Steam()
         self.gog = GOG()
         self.epic = Epic()
+        self.catalog = None
+        if CONFIG.CONFIG.getboolean("catalog", "enabled", fallback=False):
+            self.catalog = Catalog(self.epic)
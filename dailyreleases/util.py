@@ -1,9 +1,10 @@
-import difflib
 import logging
 import time
 from functools import wraps
 from typing import Sequence, List
 
+from .TitleMatcher import TitleMatcher
+
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +13,10 @@ def case_insensitive_close_matches(word: str, possibilities: Sequence[str],
                                    n=3, cutoff=0.6) -> List[str]:
     """
     Python's difflib.get_close_matches does case sensitive sequence matching,
-    this function decorates the library function to make it case insensitive.
+    this function does the same matching case insensitively. Use a TitleMatcher
+    directly to match several words against the same possibilities.
     """
-    possibilities = {sequence.lower(): sequence for sequence in possibilities}
-    close_matches = difflib.get_close_matches(
-        word.lower(), possibilities, n=n, cutoff=cutoff)
-    return [possibilities[m] for m in close_matches]
+    return TitleMatcher(possibilities).get_close_matches(word, n=n, cutoff=cutoff)
 
 
 def markdown_escape(text: str) -> str:
@@ -46,6 +45,13 @@ def markdown_escape(text: str) -> str:
     return text.translate(str.maketrans(table))
 
 
+def split_config_list(value: str) -> List[str]:
+    """
+    Split a comma separated config value, ignoring blanks.
+    """
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 def retry(attempts=3, delay=0):
     """
     Retry wrapped function `attempts` times.
@@ -0,0 +1,124 @@
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from datetime import date, timedelta
+
+from dailyreleases.Cache import Cache, MIGRATIONS
+from dailyreleases.Pre import Pre, day_bounds
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache(":memory:")
+
+    def test_bulk_insert(self):
+        now = int(time.time())
+        self.cache.insert_pres([Pre("A-GROUP", "nfo", "GROUP", now),
+                                Pre("B-GROUP", "nfo", "GROUP", now)])
+
+        self.assertEqual(["A-GROUP", "B-GROUP"],
+                         sorted(pre.dirname for pre in self.cache.get_pres_by_dirnames(
+                             ["A-GROUP", "B-GROUP", "C-GROUP"])))
+        self.assertEqual([], self.cache.get_pres_by_dirnames([]))
+
+    def test_lookup_hit_and_miss(self):
+        self.cache.insert_lookup("steam", "Aztez", "https://store.steampowered.com/app/244750")
+        self.cache.insert_lookup("gog", "Aztez", None)
+
+        self.assertEqual((True, "https://store.steampowered.com/app/244750"),
+                         self.cache.get_lookup("steam", "  AZTEZ "))
+        self.assertEqual((True, None), self.cache.get_lookup("gog", "aztez"))
+        self.assertEqual((False, None), self.cache.get_lookup("epic", "aztez"))
+        self.assertEqual("steam: 1 hits, 0 misses, gog: 1 hits, 0 misses, epic: 0 hits, 1 misses",
+                         self.cache.format_lookup_stats())
+
+    def test_negative_lookups_expire_sooner(self):
+        self.cache.cache_time = timedelta(days=1)
+        self.cache.negative_cache_time = timedelta(hours=1)
+        self.cache.insert_lookup("steam", "Aztez", "https://store.steampowered.com/app/244750")
+        self.cache.insert_lookup("gog", "Aztez", None)
+        self.cache.lookup_lru.clear()
+        self.cache.connection.execute("UPDATE lookups SET timestamp = timestamp - 7200")
+
+        self.assertEqual(True, self.cache.get_lookup("steam", "Aztez")[0])
+        self.assertEqual(False, self.cache.get_lookup("gog", "Aztez")[0])
+
+    def test_pres_to_post(self):
+        today, yesterday = day_bounds(date(2024, 1, 2)), day_bounds(date(2024, 1, 1))
+        pres = [Pre("Today-GROUP", "nfo", "GROUP", today[0]),
+                Pre("Posted-GROUP", "nfo", "GROUP", yesterday[0]),
+                Pre("Missed-GROUP", "nfo", "GROUP", yesterday[0] + 1)]
+        self.cache.insert_pres(pres)
+        self.cache.mark_posted(pres[:2])
+
+        self.assertEqual(["Missed-GROUP", "Today-GROUP"],
+                         [pre.dirname for pre in self.cache.get_pres_to_post(today, yesterday)])
+
+    def test_enrichment_is_kept(self):
+        today, yesterday = day_bounds(date(2024, 1, 2)), day_bounds(date(2024, 1, 1))
+        pre = Pre("Aztez-DARKSiDERS", "nfo", "DARKSiDERS", today[0])
+        self.cache.insert_pres([pre])
+        self.assertFalse(self.cache.get_pres_to_post(today, yesterday)[0].enriched)
+
+        pre.steam_link = "https://store.steampowered.com/app/244750"
+        pre.positive_reviews, pre.total_reviews = 90, 100
+        self.cache.update_enrichment([pre])
+        self.cache.insert_pres([Pre("Aztez-DARKSiDERS", "new nfo", "DARKSiDERS", today[0])])
+
+        cached = self.cache.get_pres_to_post(today, yesterday)[0]
+        self.assertTrue(cached.enriched)
+        self.assertEqual("new nfo", cached.nfo_link)
+        self.assertEqual(pre.steam_link, cached.steam_link)
+        self.assertEqual((90, 100), (cached.positive_reviews, cached.total_reviews))
+
+    def test_hourly_counts(self):
+        self.cache.insert_pres([Pre(f"{i}-GROUP", "nfo", "GROUP", 3600 * i) for i in range(30)])
+        counts = self.cache.get_hourly_counts()
+
+        self.assertEqual(24, len(counts))
+        self.assertEqual(30, sum(counts))
+
+
+class MigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_migrate_unversioned_cache(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE pres (id INTEGER PRIMARY KEY, dirname TEXT, "
+                           "nfo_link TEXT, group_name TEXT, timestamp INTEGER);")
+        connection.executemany("INSERT INTO pres(dirname, nfo_link, group_name, timestamp) "
+                               "VALUES (?, ?, 'GROUP', 0);",
+                               [("A-GROUP", "old"), ("A-GROUP", "new"), ("B-GROUP", "nfo")])
+        connection.commit()
+        connection.close()
+
+        cache = Cache(self.path)
+
+        version = cache.connection.execute("PRAGMA user_version;").fetchone()[0]
+        self.assertEqual(len(MIGRATIONS), version)
+        rows = cache.connection.execute("SELECT dirname, nfo_link FROM pres ORDER BY dirname;")
+        self.assertEqual([("A-GROUP", "new"), ("B-GROUP", "nfo")], [tuple(row) for row in rows])
+        # Everything cached before was posted already
+        self.assertEqual([], cache.get_pres_to_post((1, 2), (-1, 1)))
+
+        cache.insert_pres([Pre("A-GROUP", "newer", "GROUP", 0)])
+        count = cache.connection.execute("SELECT COUNT(*) FROM pres;").fetchone()[0]
+        self.assertEqual(2, count)
+
+    def test_migrations_run_once(self):
+        Cache(self.path).connection.close()
+        cache = Cache(self.path)
+
+        version = cache.connection.execute("PRAGMA user_version;").fetchone()[0]
+        self.assertEqual(len(MIGRATIONS), version)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from dailyreleases.Cassette import Cassette, CassetteAdapter, request_key
+from dailyreleases.RateLimiter import RateLimiter
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        body = f"{self.path} #{cls.requests}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(201)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_session(cassette, mode, latency=0):
+    session = requests.Session()
+    session.mount("http://", CassetteAdapter(cassette, mode, RateLimiter(), latency=latency))
+    return session
+
+
+class CassetteTestCase(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.requests = 0
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name).joinpath("cassette.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+        cassette = Cassette(self.path)
+        session = make_session(cassette, "record")
+        try:
+            recorded = [session.get(f"{url}/feed", params={"page": 1, "a": "b"}).text,
+                        session.get(f"{url}/feed", params={"a": "b", "page": 1}).text,
+                        session.post(f"{url}/graphql", json={"q": 1}).text]
+        finally:
+            server.shutdown()
+            server.server_close()
+            cassette.close()
+        return url, recorded
+
+    def test_replay(self):
+        url, recorded = self.record()
+        self.assertEqual(["/feed?page=1&a=b #1", "/feed?a=b&page=1 #2", '{"q": 1}'], recorded)
+
+        # the server is gone, everything comes from the cassette
+        cassette = Cassette(self.path)
+        session = make_session(cassette, "replay")
+        replayed = session.get(f"{url}/feed", params={"a": "b", "page": 1})
+        self.assertEqual(200, replayed.status_code)
+        self.assertEqual("text/plain; charset=utf-8", replayed.headers["content-type"])
+        self.assertEqual("/feed?page=1&a=b #1", replayed.text)
+        self.assertEqual("/feed?a=b&page=1 #2", session.get(f"{url}/feed?page=1&a=b").text)
+        # the last response is repeated once all were replayed
+        self.assertEqual("/feed?a=b&page=1 #2", session.get(f"{url}/feed?page=1&a=b").text)
+        response = session.post(f"{url}/graphql", json={"q": 1})
+        self.assertEqual((201, {"q": 1}), (response.status_code, response.json()))
+
+        with self.assertRaises(requests.ConnectionError):
+            session.post(f"{url}/graphql", json={"q": 2})
+        cassette.close()
+
+    def test_bodies_stored_once(self):
+        cassette = Cassette(self.path)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"same"
+        request = requests.Request("GET", "http://host/a").prepare()
+        for _ in range(3):
+            cassette.record(request_key(request), response)
+        counts = [cassette.connection.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+                  for table in ("bodies", "responses")]
+        self.assertEqual([1, 3], counts)
+        cassette.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from dailyreleases.stores.Catalog import Catalog
+
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.catalog = Catalog(epic=None, path=":memory:")
+        self.fetched = []
+        self.catalog.fetchers = {"steam": self.fetch_steam, "gog": self.fetch_gog}
+
+    def fetch_steam(self, last_refresh):
+        self.fetched.append(("steam", last_refresh))
+        if last_refresh is None:
+            return False, [(244750, "Aztez", "app", ""),
+                           (292030, "The Witcher 3: Wild Hunt", "app", "")]
+        return True, [(1313140, "Cult of the Lamb", "app", "")]
+
+    def fetch_gog(self, last_refresh):
+        raise ValueError("catalog is down")
+
+    def test_resolve(self):
+        self.catalog.refresh()
+
+        self.assertTrue(self.catalog.has("steam"))
+        self.assertFalse(self.catalog.has("gog"))
+        self.assertEqual("https://store.steampowered.com/app/244750",
+                         self.catalog.resolve("steam", "AZTEZ"))
+        self.assertEqual("https://store.steampowered.com/app/292030",
+                         self.catalog.resolve("steam", "The Witcher 3 Wild Hunt"))
+        self.assertIsNone(self.catalog.resolve("steam", "The Witcher 2"))
+
+    def test_incremental_refresh(self):
+        self.catalog.refresh()
+        self.catalog.refresh()
+        self.catalog.refresh_interval = 0
+        self.catalog.refresh(only_missing=True)
+        self.catalog.refresh()
+
+        self.assertEqual(2, len(self.fetched))
+        self.assertIsNotNone(self.fetched[1][1])
+        self.assertEqual("https://store.steampowered.com/app/244750",
+                         self.catalog.resolve("steam", "Aztez"))
+        self.assertEqual("https://store.steampowered.com/app/1313140",
+                         self.catalog.resolve("steam", "Cult of the Lamb"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from dailyreleases.Checkpoint import Checkpoint
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "run.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume_unfinished_run(self):
+        checkpoint = Checkpoint(self.path)
+        self.assertFalse(checkpoint.start("2024-01-01", today="2024-01-02"))
+        checkpoint.complete("filter", ["A-GROUP"])
+
+        # e.g. after a crash
+        checkpoint = Checkpoint(self.path)
+        self.assertTrue(checkpoint.start("2024-01-01", today="2024-01-03"))
+        self.assertEqual("2024-01-02", checkpoint.parameters["today"])
+        self.assertTrue(checkpoint.is_done("filter"))
+        self.assertEqual(["A-GROUP"], checkpoint.output("filter"))
+        self.assertFalse(checkpoint.is_done("enrich"))
+
+    def test_finished_or_other_run_starts_over(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.start("2024-01-01")
+        checkpoint.complete("ingest")
+        checkpoint.finish()
+        self.assertFalse(checkpoint.start("2024-01-01"))
+        self.assertFalse(checkpoint.is_done("ingest"))
+
+        checkpoint.complete("ingest")
+        self.assertFalse(Checkpoint(self.path).start("2024-01-02"))
+
+    def test_run_key(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.start("2024-01-01")
+        run_key = checkpoint.run_key
+        self.assertTrue(run_key.startswith("2024-01-01/"))
+
+        resumed = Checkpoint(self.path)
+        resumed.start("2024-01-01")
+        self.assertEqual(run_key, resumed.run_key)
+
+        # a deliberate rerun of the same day
+        resumed.finish()
+        rerun = Checkpoint(self.path)
+        rerun.start("2024-01-01")
+        self.assertNotEqual(run_key, rerun.run_key)
+
+    def test_unreadable_checkpoint(self):
+        self.path.write_text("{")
+        self.assertFalse(Checkpoint(self.path).start("2024-01-01"))
+
+
+if __name__ == "__main__":
+    unittest.main()
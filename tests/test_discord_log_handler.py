@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+import unittest
+
+from dailyreleases.DiscordLogHandler import DiscordLogHandler, MAX_CONTENT_LENGTH
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {"Retry-After": "0"}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(self.status_code)
+
+
+class FakeDiscordLogHandler(DiscordLogHandler):
+    def __init__(self, **kwargs):
+        super().__init__("http://localhost/webhook", **kwargs)
+        self.sent = []
+        self.statuses = []
+        # sending blocks until released, like a slow webhook
+        self.release = threading.Event()
+
+    def send(self, content):
+        self.release.wait()
+        self.sent.append(content)
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200)
+
+
+def make_record(message):
+    return logging.LogRecord("dailyreleases", logging.INFO, __file__, 1,
+                             message, None, None)
+
+
+def hold(handler):
+    handler.next_send = time.monotonic() + 3600
+
+
+def flush_now(handler):
+    with handler.condition:
+        handler.next_send = 0
+        handler.condition.notify()
+
+
+class DiscordLogHandlerTestCase(unittest.TestCase):
+    def test_batches_records(self):
+        handler = FakeDiscordLogHandler(interval=0)
+        handler.release.set()
+        hold(handler)
+        for i in range(100):
+            handler.emit(make_record(f"record {i:03d}" + "x" * 40))
+        flush_now(handler)
+        handler.close()
+
+        self.assertEqual(3, len(handler.sent))
+        self.assertTrue(all(len(content) <= MAX_CONTENT_LENGTH for content in handler.sent))
+        lines = "\n".join(handler.sent).splitlines()
+        self.assertEqual([f"record {i:03d}" + "x" * 40 for i in range(100)], lines)
+
+    def test_drops_when_full(self):
+        handler = FakeDiscordLogHandler(interval=0, capacity=10)
+        handler.statuses = [500, 200]
+        hold(handler)
+        for i in range(50):
+            handler.emit(make_record(f"record {i}"))
+        handler.release.set()
+        flush_now(handler)
+        while not handler.sent:
+            time.sleep(0.01)
+        handler.emit(make_record("last"))
+        handler.close()
+
+        self.assertEqual("\n".join(["(40 log records dropped)"] +
+                                   [f"record {i}" for i in range(40, 50)]),
+                         handler.sent[0])
+        # the failed message is summarized in the next one
+        self.assertEqual(["(50 log records dropped)", "last"],
+                         "\n".join(handler.sent[1:]).splitlines())
+
+    def test_ignores_own_library(self):
+        handler = FakeDiscordLogHandler()
+        record = logging.LogRecord("discord_webhook.webhook", logging.ERROR,
+                                   __file__, 1, "Webhook status code 500", None, None)
+        self.assertFalse(handler.filter(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
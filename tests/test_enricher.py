@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+
+from dailyreleases.Cache import Cache
+from dailyreleases.Enricher import Enricher
+from dailyreleases.Pre import Pre
+from dailyreleases.stores.GOG import GOG
+
+
+class FakeStore:
+    def __init__(self, links, delay=0.01):
+        self.links = links
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def search(self, game_name):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return self.links.get(game_name)
+
+    def get_appreviews(self, appid):
+        return 90, 100
+
+
+class EnricherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.steam = FakeStore({"Aztez": "https://store.steampowered.com/app/244750"})
+        self.gog = FakeStore({"Aztez": "https://www.gog.com/en/game/aztez"})
+        self.epic = FakeStore({})
+        self.cache = Cache(":memory:")
+        self.enricher = Enricher(
+            SimpleNamespace(steam=self.steam, gog=self.gog, epic=self.epic, catalog=None),
+            self.cache)
+
+    def test_enrich_sets_links_and_reviews(self):
+        pres = [Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0),
+                Pre("Unknown.Game-CODEX", "nfo_link", "CODEX", 0)]
+        self.enricher.enrich(pres)
+
+        self.assertEqual(["Aztez-DARKSiDERS", "Unknown.Game-CODEX"],
+                         [pre.dirname for pre in pres])
+        self.assertEqual("https://store.steampowered.com/app/244750", pres[0].steam_link)
+        self.assertEqual("https://www.gog.com/en/game/aztez", pres[0].gog_link)
+        self.assertIsNone(pres[0].epic_link)
+        self.assertEqual((90, 100), (pres[0].positive_reviews, pres[0].total_reviews))
+        self.assertIsNone(pres[1].steam_link)
+        self.assertEqual(0, pres[1].total_reviews)
+        self.assertIn("steam", self.enricher.format_times())
+
+    def test_per_store_concurrency_limit(self):
+        pres = [Pre(f"Game.{i}-GROUP", "nfo_link", "GROUP", 0) for i in range(20)]
+        self.enricher.enrich(pres)
+
+        self.assertLessEqual(self.gog.max_active, 2)
+        self.assertGreater(self.gog.max_active, 0)
+
+    def test_lookups_are_cached(self):
+        self.enricher.enrich([Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0)])
+        self.steam.search = self.gog.search = self.epic.search = None
+        pres = [Pre("AZTEZ.Update.v1.1-DARKSiDERS", "nfo_link", "DARKSiDERS", 0)]
+        self.enricher.enrich(pres)
+
+        self.assertEqual("https://store.steampowered.com/app/244750", pres[0].steam_link)
+        self.assertIsNone(pres[0].epic_link)
+        self.assertEqual({"steam": [1, 0], "gog": [1, 0], "epic": [1, 0], "reviews": [1, 0]},
+                         self.cache.lookup_stats)
+
+    def test_stale_reviews_are_served_and_refreshed(self):
+        self.cache.insert_reviews("244750", (1, 2))
+        self.cache.review_cache_time = timedelta(0)
+        pres = [Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0)]
+        self.enricher.enrich(pres)
+
+        self.assertEqual((1, 2), (pres[0].positive_reviews, pres[0].total_reviews))
+        self.enricher.refresh_reviews()
+        self.assertEqual(((90, 100), False), self.cache.get_reviews("244750"))
+
+    def test_failed_lookup_is_raised(self):
+        def fail(game_name):
+            raise ValueError("store is down")
+
+        self.gog.search = fail
+        with self.assertRaises(ValueError):
+            self.enricher.enrich([Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0)])
+
+    def test_enriched_pres_are_reported_before_failure(self):
+        def fail(game_name):
+            if game_name == "Broken":
+                raise ValueError("store is down")
+
+        self.epic.search = fail
+        enriched = []
+        pres = [Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0),
+                Pre("Broken-GROUP", "nfo_link", "GROUP", 0)]
+        with self.assertRaises(ValueError):
+            self.enricher.enrich(pres, on_enriched=enriched.append)
+
+        self.assertEqual([pres[0]], enriched)
+
+    def test_failed_search_is_not_a_miss(self):
+        gog = GOG()
+        # e.g. a timeout or an error status
+        gog.send_request = lambda url, parameters=None: None
+        self.enricher.store_handler.gog = gog
+        enriched = []
+        with self.assertRaises(ConnectionError):
+            self.enricher.enrich([Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", 0)],
+                                 on_enriched=enriched.append)
+
+        self.assertEqual((False, None), self.cache.get_lookup("gog", "Aztez"))
+        self.assertEqual([], enriched)
+
+
+if __name__ == "__main__":
+    unittest.main()
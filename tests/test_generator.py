@@ -0,0 +1,159 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from dailyreleases.Config import CONFIG
+from dailyreleases.Generator import Generator
+from dailyreleases.Metrics import RENDERED_ROWS
+from dailyreleases.Outbox import Outbox
+from dailyreleases.Pre import Pre
+
+
+class FakePREdbs:
+    def __init__(self, pres, failures=0):
+        self.pres = pres
+        # the first `failures` calls fail
+        self.failures = failures
+        self.calls = 0
+        self.watermarks = {}
+
+    def get_pres(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("predb is down")
+        self.watermarks["source"] = max(pre.timestamp for pre in self.pres)
+        return list(self.pres)
+
+    def commit_watermarks(self):
+        self.watermarks = {}
+
+
+class FakeEnricher:
+    def __init__(self, failing=()):
+        # dirnames whose lookups fail
+        self.failing = set(failing)
+        self.enriched = []
+
+    def enrich(self, pres, on_enriched=None):
+        for pre in pres:
+            if pre.dirname not in self.failing:
+                pre.steam_link = f"https://store.steampowered.com/app/{len(self.enriched)}"
+                self.enriched.append(pre.dirname)
+                on_enriched(pre)
+        if any(pre.dirname in self.failing for pre in pres):
+            raise ConnectionError("store is down")
+
+    def refresh_reviews(self):
+        pass
+
+    def format_times(self) -> str:
+        return ""
+
+
+class FakeOutbox(Outbox):
+    def __init__(self):
+        super().__init__(":memory:")
+
+    def start(self):
+        pass
+
+
+class GenerateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = CONFIG.DATA_DIR
+        CONFIG.DATA_DIR = Path(self.tmp.name)
+        now = int(time.time())
+        self.pres = [Pre("Aztez-DARKSiDERS", "nfo", "DARKSiDERS", now),
+                     Pre("Unknown.Game-CODEX", "nfo", "CODEX", now)]
+
+    def tearDown(self):
+        CONFIG.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def make_generator(self, predbs, enricher):
+        # a new generator on the same data dir, like after a restart
+        generator = Generator()
+        generator.predb_handler = predbs
+        generator.enricher = enricher
+        generator.outbox = FakeOutbox()
+        generator.stage_attempts = 2
+        generator.stage_retry_delay = 0
+        return generator
+
+    def test_failing_stage_is_retried(self):
+        predbs = FakePREdbs(self.pres, failures=1)
+        generator = self.make_generator(predbs, FakeEnricher())
+        generator.generate(discord_post=True, notify_urls=[])
+
+        self.assertEqual(2, predbs.calls)
+        self.assertEqual(1, len(generator.outbox.get_pending()))
+        self.assertTrue(generator.checkpoint.load()["finished"])
+
+    def test_resume_after_last_completed_stage(self):
+        predbs = FakePREdbs(self.pres)
+        enricher = FakeEnricher(failing={"Unknown.Game-CODEX"})
+        generator = self.make_generator(predbs, enricher)
+        with self.assertRaises(ConnectionError):
+            generator.generate(discord_post=True, notify_urls=[])
+        # the retry only looked up the pre that failed
+        self.assertEqual(["Aztez-DARKSiDERS"], enricher.enriched)
+        self.assertEqual([], generator.outbox.get_pending())
+
+        predbs = FakePREdbs(self.pres)
+        enricher = FakeEnricher()
+        generator = self.make_generator(predbs, enricher)
+        generator.generate(discord_post=True, notify_urls=[])
+
+        # ingest and filter completed before, enrich is redone only for the
+        # pre it failed for
+        self.assertEqual(0, predbs.calls)
+        self.assertEqual(["Unknown.Game-CODEX"], enricher.enriched)
+        self.assertEqual(["ingest", "filter", "enrich", "render", "publish", "maintain"],
+                         list(generator.checkpoint.load()["stages"]))
+        post = generator.outbox.get_pending()[0]["attachment"].decode()
+        self.assertIn("Aztez", post)
+        self.assertIn("Unknown Game", post)
+
+
+class RenderRowsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = CONFIG.DATA_DIR
+        CONFIG.DATA_DIR = Path(self.tmp.name)
+        self.generator = Generator()
+
+    def tearDown(self):
+        CONFIG.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def render(self, pres):
+        rendered = RENDERED_ROWS.get(result="rendered")
+        cached = RENDERED_ROWS.get(result="cached")
+        rows = [row for _, row in self.generator.render_rows(pres)]
+        return (rows, RENDERED_ROWS.get(result="rendered") - rendered,
+                RENDERED_ROWS.get(result="cached") - cached)
+
+    def test_changed_rows_are_rendered_again(self):
+        pres = [Pre("Aztez-DARKSiDERS", "nfo", "DARKSiDERS", 0),
+                Pre("Unknown.Game-CODEX", "nfo", "CODEX", 0)]
+        rows, rendered, cached = self.render(pres)
+        self.assertEqual((2, 0), (rendered, cached))
+
+        # e.g. the next poll, with the same pres read from the cache again
+        pres = [Pre("Aztez-DARKSiDERS", "nfo", "DARKSiDERS", 0),
+                Pre("Unknown.Game-CODEX", "nfo", "CODEX", 0)]
+        pres[0].steam_link = "https://store.steampowered.com/app/244750"
+        pres[0].positive_reviews, pres[0].total_reviews = 90, 100
+        new_rows, rendered, cached = self.render(pres)
+
+        self.assertEqual((1, 1), (rendered, cached))
+        # sorted by group
+        self.assertEqual(rows[0], new_rows[0])
+        self.assertNotEqual(rows[1], new_rows[1])
+        self.assertIn("https://store.steampowered.com/app/244750", new_rows[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dailyreleases.LiveUpdate import LiveUpdate, MAX_CONTENT_LENGTH
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    # (method, path, content) of every request
+    received = []
+
+    def reply(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).received.append((self.command, self.path.split("?")[0],
+                                    body["content"]))
+        data = json.dumps({"id": "42"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_POST = reply
+    do_PATCH = reply
+
+    def log_message(self, *args):
+        pass
+
+
+class LiveUpdateTestCase(unittest.TestCase):
+    def setUp(self):
+        WebhookHandler.received = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        self.path = Path(self.tmp.name).joinpath("live_update.json")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_publish_edits_message(self):
+        live_update = LiveUpdate(self.url, self.path)
+        self.assertTrue(live_update.publish("Day", ["a", "b"]))
+        self.assertFalse(live_update.publish("Day", ["a", "b"]))
+
+        # a restart keeps editing the same message
+        live_update = LiveUpdate(self.url, self.path)
+        self.assertTrue(live_update.publish("Day", ["a", "b2", "c"]))
+        self.assertTrue(live_update.publish("Next day", ["d"]))
+
+        self.assertEqual([
+            ("POST", "/webhook", "**Day**: 2 releases so far, 2 new or updated\na\nb"),
+            ("PATCH", "/webhook/messages/42", "**Day**: 3 releases so far, 2 new or updated\nb2\nc"),
+            ("POST", "/webhook", "**Next day**: 1 releases so far, 1 new or updated\nd"),
+        ], WebhookHandler.received)
+
+    def test_format_delta_truncates(self):
+        rows = [f"{i:03d}" + "x" * 96 for i in range(100)]
+        content = LiveUpdate.format_delta("Day", rows, 100)
+        self.assertLessEqual(len(content), MAX_CONTENT_LENGTH)
+        lines = content.splitlines()
+        self.assertEqual(f"...and {100 - len(lines) + 2} more", lines[-1])
+        self.assertEqual(rows[:len(lines) - 2], lines[1:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
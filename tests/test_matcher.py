@@ -0,0 +1,66 @@
+import difflib
+import random
+import string
+import tempfile
+import unittest
+from pathlib import Path
+
+from dailyreleases import util
+from dailyreleases.TitleMatcher import TitleMatcher, SCAN_LIMIT
+
+
+def random_titles(count, seed=0):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 8)))
+             for _ in range(500)]
+    return [" ".join(rng.choices(words, k=rng.randint(1, 5))).title()
+            for _ in range(count)]
+
+
+class TitleMatcherTestCase(unittest.TestCase):
+    def test_same_as_difflib(self):
+        titles = random_titles(SCAN_LIMIT)
+        matcher = TitleMatcher(titles)
+        lowered = {title.lower(): title for title in titles}
+        for word in random_titles(50, seed=1) + titles[:50]:
+            for cutoff in (0.6, 0.90):
+                expected = [lowered[m] for m in difflib.get_close_matches(
+                    word.lower(), lowered, n=3, cutoff=cutoff)]
+                self.assertEqual(expected, matcher.get_close_matches(word, cutoff=cutoff))
+
+    def test_case_insensitive_close_matches(self):
+        self.assertEqual(["The Witcher 3: Wild Hunt"], util.case_insensitive_close_matches(
+            "the witcher 3 wild hunt", ["The Witcher 3: Wild Hunt", "The Witcher 2"], n=1, cutoff=0.90))
+
+    def test_indexed(self):
+        titles = random_titles(5000) + ["Cult of the Lamb"]
+        matcher = TitleMatcher(titles)
+
+        self.assertTrue(matcher.index)
+        self.assertEqual(["Cult of the Lamb"], matcher.get_close_matches("CULT OF THE LAMB.", n=1, cutoff=0.90))
+        self.assertEqual([], matcher.get_close_matches("Half-Life 3", n=1, cutoff=0.90))
+        for title in titles[:100]:
+            self.assertEqual(title, matcher.get_close_matches(title, n=1)[0])
+
+    def test_save_and_load(self):
+        matcher = TitleMatcher(random_titles(1000))
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "titles.index")
+            matcher.save(path)
+            loaded = TitleMatcher.load(path)
+            self.assertIsNone(TitleMatcher.load(Path(directory, "missing.index")))
+
+        self.assertEqual(matcher.titles, loaded.titles)
+        self.assertEqual(matcher.get_close_matches("Foo Bar"), loaded.get_close_matches("Foo Bar"))
+
+    def test_match_many(self):
+        titles = random_titles(1000)
+        matcher = TitleMatcher(titles)
+        words = titles[:20]
+
+        self.assertEqual([matcher.get_close_matches(word) for word in words],
+                         matcher.get_close_matches_many(words, workers=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import requests
+
+from dailyreleases.Metrics import Registry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_format(self):
+        registry = Registry()
+        requests_total = registry.counter("requests_total", "Requests")
+        requests_total.inc(host="a", status=200)
+        requests_total.inc(2, host="a", status=200)
+        requests_total.inc(host='b"', status="error")
+        registry.gauge("run_seconds", "Run").set(1.5)
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        latency.observe(0.05, store="steam")
+        latency.observe(0.5, store="steam")
+        latency.observe(5, store="steam")
+
+        self.assertEqual(
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{store="steam",le="0.1"} 1\n'
+            'latency_seconds_bucket{store="steam",le="1"} 2\n'
+            'latency_seconds_bucket{store="steam",le="+Inf"} 3\n'
+            'latency_seconds_sum{store="steam"} 5.55\n'
+            'latency_seconds_count{store="steam"} 3\n'
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{host="a",status="200"} 3\n'
+            'requests_total{host="b\\"",status="error"} 1\n'
+            "# HELP run_seconds Run\n"
+            "# TYPE run_seconds gauge\n"
+            "run_seconds 1.5\n",
+            registry.format())
+
+    def test_registering_again(self):
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests")
+        self.assertIs(counter, registry.counter("requests_total", "Requests"))
+
+    def test_write_and_serve(self):
+        registry = Registry()
+        registry.counter("runs_total", "Runs").inc()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp).joinpath("metrics.prom")
+            registry.write(path)
+            self.assertIn("runs_total 1\n", path.read_text())
+
+        registry.serve("127.0.0.1", 0)
+        try:
+            url = f"http://127.0.0.1:{registry.server.server_port}"
+            self.assertEqual(registry.format(), requests.get(f"{url}/metrics").text)
+            self.assertEqual(404, requests.get(f"{url}/other").status_code)
+        finally:
+            registry.server.shutdown()
+            registry.server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
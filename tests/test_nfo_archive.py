@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from dailyreleases.NfoArchive import NfoArchive
+
+
+class NfoArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = Path(self.tmp.name, "nfo-archive")
+        self.archive = NfoArchive(self.archive_dir, pack_size=1024)
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_put_and_get(self):
+        nfos = {f"Game.{i}-GROUP": bytes(range(256)) * (i + 1) for i in range(20)}
+        for dirname, nfo in nfos.items():
+            self.archive.put(dirname, ".nfo", nfo)
+
+        for dirname, nfo in nfos.items():
+            self.assertEqual((nfo, ".nfo"), self.archive.get(dirname))
+        self.assertIsNone(self.archive.get("Missing-GROUP"))
+        self.assertGreater(len(list(self.archive_dir.glob("*.pack"))), 1)
+
+    def test_duplicates_are_stored_once(self):
+        first = self.archive.put("Game-GROUP", ".nfo", b"same nfo")
+        second = self.archive.put("Game-MIRROR", ".nfo", b"same nfo")
+
+        self.assertEqual(first, second)
+        self.assertEqual((b"same nfo", ".nfo"), self.archive.get("Game-MIRROR"))
+        count = self.archive.connection.execute("SELECT COUNT(*) FROM blobs;").fetchone()[0]
+        self.assertEqual(1, count)
+
+    def test_reopen(self):
+        self.archive.put("Game-GROUP", ".nfo", b"nfo")
+        self.archive.close()
+        self.archive = NfoArchive(self.archive_dir)
+
+        self.assertTrue(self.archive.has("Game-GROUP"))
+        self.assertEqual((b"nfo", ".nfo"), self.archive.get("Game-GROUP"))
+
+    def test_import_loose_files(self):
+        nfo_dir = Path(self.tmp.name, "nfo")
+        nfo_dir.mkdir()
+        nfo_dir.joinpath("A.Game-GROUP.nfo").write_bytes(b"nfo")
+        nfo_dir.joinpath("A.Game-MIRROR.nfo").write_bytes(b"nfo")
+        nfo_dir.joinpath("B.Game-GROUP.png").write_bytes(b"png")
+        nfo_dir.joinpath("C.Game-GROUP.nfo.part").write_bytes(b"partial")
+
+        self.assertEqual((3, 1), self.archive.import_files(nfo_dir, remove=True))
+        self.assertEqual((b"png", ".png"), self.archive.get("B.Game-GROUP"))
+        self.assertEqual(["C.Game-GROUP.nfo.part"], [path.name for path in nfo_dir.iterdir()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from dailyreleases.NfoArchive import NfoArchive
+from dailyreleases.NfoBackup import NfoBackup
+from dailyreleases.Pre import Pre
+
+
+class FakeResponse:
+    def __init__(self, body, content_type):
+        self.body = body
+        self.headers = {"Content-Type": content_type}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeNfoBackup(NfoBackup):
+    def __init__(self, archive):
+        super().__init__(archive)
+        self.workers = 2
+        self.chunk_size = 4
+        self.requested = []
+        self.active = 0
+        self.max_active = 0
+        self.active_lock = threading.Lock()
+
+    def send_request(self, url, parameters=None, headers=None, stream=False):
+        with self.active_lock:
+            self.requested.append(url)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if url == "broken":
+                return None
+            if url.endswith(".png"):
+                return FakeResponse(b"\x89PNG image", "image/png")
+            return FakeResponse(f"NFO of {url}".encode(), "text/plain; charset=utf-8")
+        finally:
+            with self.active_lock:
+                self.active -= 1
+
+
+class NfoBackupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = NfoArchive(Path(self.tmp.name))
+        self.backup = FakeNfoBackup(self.archive)
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_backup(self):
+        pres = [Pre(f"Game.{i}-GROUP", f"nfo{i}", "GROUP", 0) for i in range(10)]
+        pres.append(Pre("Image-GROUP", "nfo.png", "GROUP", 0))
+        pres.append(Pre("Broken-GROUP", "broken", "GROUP", 0))
+        self.backup.backup(pres)
+        self.backup.wait()
+
+        self.assertEqual((b"NFO of nfo3", ".txt"), self.archive.get("Game.3-GROUP"))
+        self.assertEqual((b"\x89PNG image", ".png"), self.archive.get("Image-GROUP"))
+        self.assertIsNone(self.archive.get("Broken-GROUP"))
+        self.assertLessEqual(self.backup.max_active, 2)
+
+    def test_stored_nfos_are_skipped(self):
+        self.archive.put("Stored-GROUP", ".txt", b"old")
+        self.backup.backup([Pre("Stored-GROUP", "nfo", "GROUP", 0), Pre("New-GROUP", "nfo", "GROUP", 0)])
+        self.backup.wait()
+        self.backup.backup([Pre("New-GROUP", "nfo", "GROUP", 0)])
+        self.backup.wait()
+
+        self.assertEqual(["nfo"], self.backup.requested)
+        self.assertEqual((b"old", ".txt"), self.archive.get("Stored-GROUP"))
+
+if __name__ == "__main__":
+    unittest.main()
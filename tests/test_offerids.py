@@ -0,0 +1,53 @@
+import unittest
+from types import SimpleNamespace
+
+from dailyreleases.stores.OfferIds import OfferIds
+
+
+class FakeOfferIds(OfferIds):
+    def __init__(self):
+        self.requests = []
+        self.down = False
+        super().__init__(path=":memory:")
+
+    def send_request(self, url, parameters=None, headers=None):
+        self.requests.append(headers)
+        if self.down:
+            return None
+        if headers.get("If-None-Match") == '"v1"':
+            return SimpleNamespace(status_code=304, headers={})
+        return SimpleNamespace(status_code=200, headers={"ETag": '"v1"'},
+                               json=lambda: {"abc": "aztez", "def": "cult-of-the-lamb"})
+
+
+class OfferIdsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.offerids = FakeOfferIds()
+
+    def test_loaded_once(self):
+        self.assertEqual("aztez", self.offerids.get("abc"))
+        self.assertEqual("cult-of-the-lamb", self.offerids.get("def"))
+        self.assertIsNone(self.offerids.get("missing"))
+        self.assertEqual([{}], self.offerids.requests)
+
+    def test_revalidation(self):
+        self.assertTrue(self.offerids.refresh())
+        self.assertFalse(self.offerids.refresh())
+        self.assertEqual({"If-None-Match": '"v1"'}, self.offerids.requests[1])
+        self.assertEqual("aztez", self.offerids.get("abc"))
+
+    def test_stale_map_is_revalidated(self):
+        self.offerids.get("abc")
+        self.offerids.max_age = 0
+        self.assertEqual("aztez", self.offerids.get("abc"))
+        self.assertEqual([{}, {"If-None-Match": '"v1"'}], self.offerids.requests)
+
+        # a failed revalidation keeps the old map and isn't retried every lookup
+        self.offerids.down = True
+        self.assertEqual("aztez", self.offerids.get("abc"))
+        self.assertEqual("cult-of-the-lamb", self.offerids.get("def"))
+        self.assertEqual(5, len(self.offerids.requests))
+
+
+if __name__ == "__main__":
+    unittest.main()
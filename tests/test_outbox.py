@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from dailyreleases.Outbox import DeliveryError, Outbox
+
+
+class FakeOutbox(Outbox):
+    def __init__(self):
+        super().__init__(":memory:")
+        self.retry_delay = 0
+        self.max_attempts = 3
+        self.sent = []
+        self.failing = set()
+        # destinations that are slow to answer
+        self.slow = {}
+
+    def send(self, message):
+        if message["destination"] in self.slow:
+            self.slow[message["destination"]].wait()
+        if message["destination"] in self.failing:
+            raise DeliveryError("status 500")
+        self.sent.append((message["destination"], message["content"]))
+
+
+class OutboxTestCase(unittest.TestCase):
+    def test_idempotency(self):
+        outbox = FakeOutbox()
+        self.assertTrue(outbox.put("run/post/a", "a", "post"))
+        self.assertFalse(outbox.put("run/post/a", "a", "post"))
+        outbox.deliver()
+        # retrying the publish after delivery doesn't post again
+        self.assertFalse(outbox.put("run/post/a", "a", "post"))
+        outbox.deliver()
+        self.assertEqual([("a", "post")], outbox.sent)
+        self.assertEqual("sent", outbox.get_status("run/post/a"))
+
+    def test_failing_destination(self):
+        outbox = FakeOutbox()
+        outbox.failing.add("b")
+        outbox.put("1/a", "a", "first")
+        outbox.put("1/b", "b", "first")
+        outbox.put("2/b", "b", "second")
+        outbox.put("2/a", "a", "second")
+        outbox.deliver()
+        self.assertEqual([("a", "first"), ("a", "second")], outbox.sent)
+        self.assertEqual("pending", outbox.get_status("1/b"))
+
+        outbox.failing.clear()
+        outbox.deliver()
+        # messages to the same destination stay in order
+        self.assertEqual([("b", "first"), ("b", "second")], outbox.sent[2:])
+
+    def test_gives_up(self):
+        outbox = FakeOutbox()
+        outbox.failing.add("a")
+        outbox.put("1/a", "a", "post")
+        for _ in range(5):
+            outbox.deliver()
+        self.assertEqual("failed", outbox.get_status("1/a"))
+        self.assertEqual(0, outbox.count_pending())
+
+    def test_slow_destination(self):
+        outbox = FakeOutbox()
+        outbox.slow["a"] = threading.Event()
+        outbox.put("1/a", "a", "post")
+        outbox.put("1/b", "b", "post")
+        outbox.start()
+        deadline = time.monotonic() + 5
+        while outbox.get_status("1/b") != "sent" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([("b", "post")], outbox.sent)
+
+        outbox.slow["a"].set()
+        self.assertTrue(outbox.drain(5))
+        outbox.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import time
+import unittest
+from datetime import date
+
+from dailyreleases.parsing import ReleaseType, Platform, ParseError, parse_dirname, parse_pre
+from dailyreleases.Pre import Pre, day_bounds
+
+
+class ParseDirnameTestCase(unittest.TestCase):
+    def test_single_word_release(self):
+        r = parse_dirname("Aztez-DARKSiDERS")
+
+        self.assertEqual("Aztez-DARKSiDERS", r.dirname)
+        self.assertEqual("Aztez", r.rls_name)
+        self.assertEqual("Aztez", r.game_name)
+        self.assertEqual("DARKSiDERS", r.group)
+        self.assertEqual(Platform.WINDOWS, r.platform)
+        self.assertEqual(ReleaseType.GAME, r.type)
+        self.assertEqual((), r.tags)
+        self.assertEqual((), r.highlights)
+
+    def test_update(self):
+        r = parse_dirname("Car.Mechanic.Simulator.2018.Plymouth.Update.v1.5.1.Hotfix-PLAZA")
+        self.assertEqual("Car Mechanic Simulator 2018 Plymouth", r.game_name)
+        self.assertEqual(ReleaseType.UPDATE, r.type)
+        self.assertEqual(("Hotfix",), r.tags)
+
+    def test_build_is_update(self):
+        r = parse_dirname("DUSK.Episode.1.Build.2.6-SKIDROW")
+        self.assertEqual("DUSK Episode 1", r.game_name)
+        self.assertEqual(ReleaseType.UPDATE, r.type)
+
+    def test_dlc(self):
+        self.assertEqual(ReleaseType.DLC, parse_dirname("Fallout.4.Far.Harbor.DLC-CODEX").type)
+        self.assertEqual(ReleaseType.GAME, parse_dirname("Mutiny.Incl.DLC-DARKSiDERS").type)
+        self.assertEqual(ReleaseType.UPDATE,
+                         parse_dirname("Wolfenstein.II.The.New.Colossus.Update.5.incl.DLC-CODEX").type)
+
+    def test_platforms(self):
+        r = parse_dirname("The_Fall_Part_2_Unbound_MacOS-Razor1911")
+        self.assertEqual("The Fall Part 2 Unbound", r.game_name)
+        self.assertEqual(Platform.OSX, r.platform)
+        r = parse_dirname("Sphinx_And_The_Cursed_Mummy_Linux-Razor1911")
+        self.assertEqual(Platform.LINUX, r.platform)
+
+    def test_tags_and_highlights(self):
+        r = parse_dirname("The.Curious.Expedition.v1.3.7.1.MULTI.7.RIP-Unleashed")
+        self.assertEqual("The Curious Expedition", r.game_name)
+        self.assertEqual(("MULTI.7", "RIP"), r.tags)
+        r = parse_dirname("Death.Coming.PROPER-SiMPLEX")
+        self.assertEqual(("PROPER",), r.highlights)
+
+    def test_abbreviated_name(self):
+        self.assertEqual("R.O.V.E.R The Game", parse_dirname("R.O.V.E.R.The.Game-HOODLUM").game_name)
+        self.assertEqual("Tick Tock A Tale for Two",
+                         parse_dirname("Tick.Tock.A.Tale.for.Two-DARKSiDERS").game_name)
+        self.assertEqual("GTA 5 The Complete Edition",
+                         parse_dirname("GTA.5.The.Complete.Edition-TEST").game_name)
+
+    def test_hyphenated_name(self):
+        r = parse_dirname("Half-Life.2-GROUP")
+        self.assertEqual("Half Life 2", r.game_name)
+        self.assertEqual("GROUP", r.group)
+
+    def test_memoized(self):
+        self.assertIs(parse_dirname("Aztez-DARKSiDERS"), parse_dirname("Aztez-DARKSiDERS"))
+
+
+class ParsePreTestCase(unittest.TestCase):
+    def test_error_on_blacklisted_word(self):
+        pre = Pre("Anthemion.Software.DialogBlocks.v5.15.LINUX.Incl.Keygen-AMPED",
+                  "nfo_link", "AMPED", time.time())
+        with self.assertRaisesRegex(ParseError, "Contains blacklisted word"):
+            parse_pre(pre)
+
+    def test_error_on_old(self):
+        pre = Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", time.time() - 50 * 3600)
+        with self.assertRaisesRegex(ParseError, "Older than 48 hours"):
+            parse_pre(pre)
+
+    def test_pre_delegates(self):
+        pre = Pre("Fallout.4.Far.Harbor.DLC-CODEX", "nfo_link", "CODEX", time.time())
+        self.assertEqual("Fallout 4 Far Harbor", pre.game_name)
+        self.assertEqual(ReleaseType.DLC, pre.release_type)
+        self.assertEqual("dlc", pre.release_type)
+
+    def test_pre_is_parsed_lazily(self):
+        pre = Pre("Aztez-DARKSiDERS", "nfo_link", "DARKSiDERS", time.time())
+        self.assertFalse(hasattr(pre, "__dict__"))
+        self.assertIsNone(pre._parsed)
+        self.assertEqual("Aztez", pre.game_name)
+        self.assertIsNotNone(pre._parsed)
+
+    def test_day_bounds(self):
+        start, end = day_bounds(date(2024, 1, 2))
+        self.assertEqual((1704153600, 1704240000), (start, end))
+        self.assertTrue(Pre("A-B", "", "B", start).from_today((start, end)))
+        self.assertFalse(Pre("A-B", "", "B", end).from_today((start, end)))
+        self.assertTrue(Pre("A-B", "", "B", start - 1).from_yesterday(day_bounds(date(2024, 1, 1))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import time
+import unittest
+
+from dailyreleases.Cache import Cache
+from dailyreleases.PREdbs import PREdbs
+from dailyreleases.Pre import Pre
+
+
+def pre(dirname, source):
+    return Pre(dirname, source, "GROUP", 0)
+
+
+class GetPresTestCase(unittest.TestCase):
+    def setUp(self):
+        self.predbs = PREdbs()
+        self.predbs.get_predbde = lambda: ([pre("A-GROUP", "predb"), pre("B-GROUP", "predb")], 10)
+        self.predbs.get_xrel_p2p = lambda: ([pre("B-GROUP", "p2p"), pre("C-GROUP", "p2p")], 10)
+        self.predbs.get_xrel_scene_category = lambda category: (
+            [pre("C-GROUP", category), pre(f"{category}-GROUP", category)], 10)
+
+    def test_merge_order_of_preference(self):
+        pres = {p.dirname: p.nfo_link for p in self.predbs.get_pres()}
+
+        self.assertEqual("predb", pres["A-GROUP"])
+        self.assertEqual("p2p", pres["B-GROUP"])
+        self.assertEqual("UPDATE", pres["C-GROUP"])
+        self.assertEqual("CRACKED", pres["CRACKED-GROUP"])
+
+    def test_failing_source_is_skipped(self):
+        def fail():
+            raise ValueError("predb is down")
+
+        self.predbs.get_xrel_p2p = fail
+        pres = {p.dirname: p.nfo_link for p in self.predbs.get_pres()}
+
+        self.assertEqual("predb", pres["B-GROUP"])
+        self.assertEqual("UPDATE", pres["C-GROUP"])
+
+    def test_slow_source_is_skipped(self):
+        def slow():
+            time.sleep(0.5)
+            return [pre("B-GROUP", "p2p")], 20
+
+        self.predbs.get_xrel_p2p = slow
+        self.predbs.timeout = 0.2
+        start = time.monotonic()
+        pres = {p.dirname: p.nfo_link for p in self.predbs.get_pres()}
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual("predb", pres["B-GROUP"])
+        # The watermark of the skipped source doesn't move, even once its
+        # thread finishes
+        time.sleep(0.5)
+        self.assertEqual(10, self.predbs.watermarks["predb.net"])
+        self.assertNotIn("xrel.to p2p", self.predbs.watermarks)
+
+
+class WatermarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = int(time.time())
+        self.cache = Cache(":memory:")
+        self.predbs = PREdbs(self.cache)
+        self.predbs.overlap = 0
+        # 250 releases a minute apart, newest first, 100 per page
+        self.releases = [Pre(f"R{i}-GROUP", "", "GROUP", self.now - 60 * i) for i in range(250)]
+        self.requested = []
+
+    def get_page(self, page):
+        self.requested.append(page)
+        return self.releases[(page - 1) * 100:page * 100], page >= 3
+
+    def test_pages_until_watermark(self):
+        pres, watermark = self.predbs.get_pages("source", self.get_page)
+        self.assertEqual(250, len(pres))
+        self.assertEqual([1, 2, 3], self.requested)
+        self.predbs.move_watermark("source", watermark)
+        self.predbs.commit_watermarks()
+        self.assertEqual(self.now, self.cache.get_watermark("source"))
+
+        self.releases[:0] = [Pre("NEW-GROUP", "", "GROUP", self.now + 60)]
+        self.requested = []
+        pres, watermark = self.predbs.get_pages("source", self.get_page)
+
+        self.assertEqual(self.now + 60, watermark)
+        self.assertEqual(["NEW-GROUP", "R0-GROUP"], [pre.dirname for pre in pres])
+        self.assertEqual([1], self.requested)
+
+    def test_watermark_only_committed(self):
+        self.predbs.move_watermark("source", self.predbs.get_pages("source", self.get_page)[1])
+        self.assertIsNone(self.cache.get_watermark("source"))
+
+    def test_failed_page_keeps_watermark(self):
+        pres, watermark = self.predbs.get_pages(
+            "source", lambda page: self.get_page(page) if page == 1 else None)
+        self.assertEqual(100, len(pres))
+        self.assertIsNone(watermark)
+
+    def test_page_cap_keeps_watermark(self):
+        self.predbs.max_pages = 2
+        pres, watermark = self.predbs.get_pages("source", self.get_page)
+        self.assertEqual(200, len(pres))
+        self.assertIsNone(watermark)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from dailyreleases.Profiler import StackSampler
+
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class StackSamplerTestCase(unittest.TestCase):
+    def test_sample(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy, args=(stop,))
+        thread.start()
+        sampler = StackSampler(interval=0.001)
+        try:
+            for _ in range(5):
+                sampler.sample()
+        finally:
+            stop.set()
+            thread.join()
+
+        self.assertEqual(5, sampler.samples)
+        self.assertTrue(any(stack[-1].startswith("busy (test_profiler.py:")
+                            for stack in sampler.stacks))
+
+    def test_format(self):
+        sampler = StackSampler(interval=0.01)
+        sampler.stacks.update({("main", "generate", "search"): 3,
+                               ("main", "generate"): 1})
+        sampler.samples = sampler.thread_samples = 4
+
+        self.assertEqual("main;generate;search 3\nmain;generate 1\n",
+                         sampler.format_folded())
+        report = sampler.format_report(top=10)
+        self.assertIn("       3  75.0%  search", report)
+        self.assertIn("       4 100.0%  generate", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
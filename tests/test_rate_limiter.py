@@ -0,0 +1,132 @@
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from dailyreleases.RateLimiter import HostLimit, RateLimiter, RateLimitedAdapter, parse_retry_after
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    # the first `throttled` requests are answered with 429
+    throttled = 0
+    requests = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        if cls.requests <= cls.throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class HostLimitTestCase(unittest.TestCase):
+    def test_token_bucket(self):
+        limit = HostLimit("host", max_rate=20, burst=2, max_concurrency=8)
+        start = time.monotonic()
+        for _ in range(6):
+            limit.acquire()
+            limit.release()
+
+        # 2 burst tokens, then 4 refilled at ~20/s
+        self.assertGreater(time.monotonic() - start, 0.15)
+
+    def test_backoff_and_ramp_up(self):
+        limit = HostLimit("host", max_rate=10, burst=10, max_concurrency=8)
+        limit.acquire()
+        limit.release(throttled=True, retry_after=0)
+        self.assertEqual({"rate": 5, "concurrency": 4, "in_flight": 0, "blocked_for": 0},
+                         limit.snapshot())
+
+        for _ in range(20):
+            limit.acquire()
+            limit.release()
+        self.assertEqual(10, limit.snapshot()["rate"])
+        self.assertGreater(limit.snapshot()["concurrency"], 4)
+
+    def test_concurrency_limit(self):
+        limit = HostLimit("host", max_rate=1000, burst=100, max_concurrency=2)
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def request():
+            limit.acquire()
+            with lock:
+                active.append(1)
+                max_active.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            limit.release()
+
+        threads = [threading.Thread(target=request) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, max(max_active))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(3, parse_retry_after("3"))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertEqual(0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+
+
+class RateLimitedAdapterTestCase(unittest.TestCase):
+    def setUp(self):
+        ThrottlingHandler.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.limiter = RateLimiter()
+        self.session = requests.Session()
+        self.session.mount("http://", RateLimitedAdapter(self.limiter))
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_throttled_request_is_retried(self):
+        ThrottlingHandler.throttled = 2
+        response = self.session.get(self.url, timeout=5)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, ThrottlingHandler.requests)
+        host = f"127.0.0.1:{self.server.server_port}"
+        self.assertLess(self.limiter.snapshot()[host]["rate"], self.limiter.max_rate)
+
+    def test_gives_up_after_retries(self):
+        ThrottlingHandler.throttled = 100
+        self.limiter.retries = 1
+        response = self.session.get(self.url, timeout=5)
+
+        self.assertEqual(429, response.status_code)
+        self.assertEqual(2, ThrottlingHandler.requests)
+
+    def test_default_timeout(self):
+        # Accepts connections but never answers
+        hung = socket.socket()
+        hung.bind(("127.0.0.1", 0))
+        hung.listen()
+        self.session.mount("http://", RateLimitedAdapter(self.limiter, timeout=(1, 0.2)))
+        try:
+            with self.assertRaises(requests.ReadTimeout):
+                self.session.post(f"http://127.0.0.1:{hung.getsockname()[1]}/")
+        finally:
+            hung.close()
+
+
+if __name__ == "__main__":
+    unittest.main()